@@ -0,0 +1,212 @@
+import itertools
+import numpy as np
+
+# A fluid satellite deforms as it nears the primary, which raises the tides on it,
+# so it comes apart about 2.44 times further out than a rigid one of the same density.
+FLUID_ROCHE_COEFFICIENT = 2.44
+
+# A swarm counts as disrupted once clusters inside their fluid Roche limit have carried
+# off all but this fraction of the mass the largest cluster held when monitoring began.
+DISRUPTION_FRACTION = 0.5
+
+
+def rocheRadii(primaryMass, masses, radii):
+    """
+    Returns the (rigid, fluid) Roche limits of satellites with the given masses and radii:
+    the distances from the primary's centre inside which its tides overcome their self-gravity.
+    Works on scalars or arrays; massless satellites have infinite limits.
+    """
+    masses = np.asarray(masses, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+    scale = np.where(masses > 0, radii * (primaryMass / np.where(masses > 0, masses, 1)) ** (1 / 3.0), np.inf)
+    return 2 ** (1 / 3.0) * scale, FLUID_ROCHE_COEFFICIENT * scale
+
+
+def linkPairs(positions, sizes, linkingLength):
+    """
+    Returns index arrays (i, j) listing once each pair of bodies closer than the larger of
+    linkingLength and the sum of their sizes.
+    Bodies no bigger than half the linking length are binned into a grid of cells linkingLength
+    across, so each is only compared with bodies in its own and the adjacent cells. The few
+    bodies bigger than that are compared with everything.
+    """
+    dimensions = positions.shape[1]
+    large = sizes > 0.5 * linkingLength
+    first, second = [], []
+
+    small = np.flatnonzero(~large)
+    if len(small) > 1 and linkingLength > 0:
+        cells = np.floor(positions[small] / linkingLength).astype(np.int64)
+        # Offset by one so neighbouring cells never wrap around an edge of the grid.
+        cells -= cells.min(axis=0) - 1
+        strides = np.cumprod(np.concatenate(([1], cells.max(axis=0)[:-1] + 2)))
+        keys = cells.dot(strides)
+        order = np.argsort(keys, kind='mergesort')
+        sortedKeys = keys[order]
+        rank = np.empty(len(small), dtype=np.int64)
+        rank[order] = np.arange(len(small))
+
+        # Half of the adjacent cells (the first non-zero step positive) and the cell itself,
+        # so every pair of cells is visited once.
+        for offset in itertools.product((0, 1, -1), repeat=dimensions):
+            nonzero = [step for step in offset if step]
+            if nonzero and nonzero[0] < 0:
+                continue
+            neighbourKeys = keys + np.dot(offset, strides)
+            if nonzero:
+                lo = np.searchsorted(sortedKeys, neighbourKeys, 'left')
+            else:
+                lo = rank + 1
+            hi = np.searchsorted(sortedKeys, neighbourKeys, 'right')
+            counts = np.maximum(hi - lo, 0)
+            total = counts.sum()
+            if not total:
+                continue
+
+            # Every (body, candidate) pair in one flat array.
+            i = np.repeat(np.arange(len(small)), counts)
+            j = order[np.repeat(lo, counts) + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)]
+            dr = positions[small[j]] - positions[small[i]]
+            near = np.einsum('ij,ij->i', dr, dr) < linkingLength ** 2
+            first.append(small[i[near]])
+            second.append(small[j[near]])
+
+    for body in np.flatnonzero(large):
+        dr = positions - positions[body]
+        reach = np.maximum(linkingLength, sizes + sizes[body])
+        near = np.einsum('ij,ij->i', dr, dr) < reach ** 2
+        # Pairs of two large bodies are found from the lower index only.
+        near[:body + 1] &= ~large[:body + 1]
+        near[body] = False
+        others = np.flatnonzero(near)
+        first.append(np.minimum(body, others))
+        second.append(np.maximum(body, others))
+
+    if not first:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def clusterLabels(count, i, j):
+    """ Union-find over the links (i, j): returns each body's root, the lowest index in its cluster """
+    return _unionFind(count, i, j)[0]
+
+
+def _unionFind(count, i, j):
+    # Returns the roots along with how many union passes it took to find them.
+    labels = np.arange(count)
+    passes = 0
+    while True:
+        # Path compression, a whole level at a time, until every body points at its root.
+        while True:
+            roots = labels[labels]
+            if (roots == labels).all():
+                break
+            labels = roots
+
+        rootI, rootJ = labels[i], labels[j]
+        joining = rootI != rootJ
+        if not joining.any():
+            return labels, passes
+        # Union: each link hangs the higher root under the lower. A root listed by several
+        # links goes under the lowest of them, so a hub joins all its spokes in one pass.
+        low, high = np.minimum(rootI[joining], rootJ[joining]), np.maximum(rootI[joining], rootJ[joining])
+        np.minimum.at(labels, high, low)
+        passes += 1
+
+
+class Clusters:
+    """ The clusters a swarm has broken into at one instant, largest first """
+
+    def __init__(self, labels, masses, centres, radii):
+        # Index into the per-cluster arrays for every body.
+        self.labels = labels
+        self.masses = masses
+        self.centres = centres
+        # Radius of the uniform sphere with the cluster's mass and moment of inertia,
+        # so a single body's cluster has that body's size.
+        self.radii = radii
+        # Filled in by findClusters when the universe has a primary.
+        self.distances = None
+        self.rigidLimits = None
+        self.fluidLimits = None
+
+    def __len__(self):
+        return len(self.masses)
+
+    def insideRigidLimit(self):
+        return self.distances < self.rigidLimits
+
+    def insideFluidLimit(self):
+        return self.distances < self.fluidLimits
+
+
+def findClusters(universe, linkingLength=None):
+    """
+    Groups universe.bodies into clusters of touching bodies (friends-of-friends), and
+    measures each cluster's distance from the primary and its Roche limits.
+    linkingLength defaults to twice the median body size, i.e. typical fragments touching.
+    Costs a few vectorised passes over the bodies and their links (about a tenth of a step
+    for the 10k rubble pile), so it can be called every step.
+    """
+    if universe._packed != universe.bodies:
+        universe.reload()
+    positions = universe.getPositions()
+    sizes = universe.sizes.astype(float)
+    masses = universe.masses
+    if linkingLength is None:
+        linkingLength = 2 * np.median(sizes) if len(sizes) else 0
+
+    i, j = linkPairs(positions, sizes, linkingLength)
+    roots, labels = np.unique(clusterLabels(len(positions), i, j), return_inverse=True)
+
+    clusterMasses = np.bincount(labels, weights=masses, minlength=len(roots))
+    weights = np.where(clusterMasses > 0, clusterMasses, 1)
+    centres = np.column_stack([np.bincount(labels, weights=masses * positions[:, axis], minlength=len(roots))
+                               for axis in range(positions.shape[1])]) / weights[:, None]
+    offsets = positions - centres[labels]
+    inertia = np.bincount(labels, weights=masses * (np.einsum('ij,ij->i', offsets, offsets) + 0.6 * sizes ** 2),
+                          minlength=len(roots))
+    radii = np.sqrt(inertia / weights / 0.6)
+
+    # Largest first; ties keep the order of their lowest body.
+    order = np.argsort(-clusterMasses, kind='mergesort')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    clusters = Clusters(rank[labels], clusterMasses[order], centres[order], radii[order])
+
+    if universe.primary:
+        primary = universe._stack([universe.primary.position])[0]
+        clusters.distances = np.sqrt(((clusters.centres - primary) ** 2).sum(axis=1))
+        clusters.rigidLimits, clusters.fluidLimits = rocheRadii(universe.primary.mass, clusters.masses, clusters.radii)
+    return clusters
+
+
+class DisruptionMonitor:
+    """
+    Follows a swarm's clusters through a run and records when the primary's tides start
+    to break it up: the first update at which the clusters split off the largest one that
+    are inside their own fluid Roche limit hold more than 1 - fraction of the mass the
+    largest cluster held at the first update. Fragments drifting apart outside the limit,
+    or with no primary at all, are not a disruption.
+    """
+
+    def __init__(self, universe, linkingLength=None, fraction=DISRUPTION_FRACTION):
+        self.universe = universe
+        self.linkingLength = linkingLength
+        self.fraction = fraction
+        self.initialMass = None
+        # Simulated time of disruption onset, or None while the swarm holds together.
+        self.onset = None
+        self.clusters = None
+
+    def update(self):
+        """ Re-clusters the swarm and returns the Clusters """
+        self.clusters = clusters = findClusters(self.universe, self.linkingLength)
+        if self.initialMass is None:
+            self.initialMass = clusters.masses[0] if len(clusters) else 0
+        elif self.onset is None and clusters.distances is not None:
+            shed = clusters.masses[1:][clusters.insideFluidLimit()[1:]].sum()
+            if shed > (1 - self.fraction) * self.initialMass:
+                self.onset = self.universe.time
+        return clusters
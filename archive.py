@@ -0,0 +1,47 @@
+import numpy as np
+
+# Why a body was retired from a run.
+ESCAPED = 1     # left the bounds on an orbit that won't bring it back
+IMPACTED = 2    # fell inside the primary
+NEGLIGIBLE = 3  # too light to matter
+REASONS = {ESCAPED: 'escaped', IMPACTED: 'impacted', NEGLIGIBLE: 'negligible'}
+
+# One fixed-size row per retired body; 2D states are stored with z = 0.
+RECORD = np.dtype([('time', float), ('reason', np.int8), ('mass', float), ('size', float),
+                   ('position', float, 3), ('velocity', float, 3)])
+
+
+class Archive:
+    """
+    The bodies retired from an Environment, kept as a compact record array rather than
+    as Body objects, so a long run holds on to about 70 bytes per retired body and no trails.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def add(self, time, reasons, masses, sizes, positions, velocities):
+        chunk = np.zeros(len(reasons), dtype=RECORD)
+        chunk['time'] = time
+        chunk['reason'] = reasons
+        chunk['mass'] = masses
+        chunk['size'] = sizes
+        chunk['position'][:, :positions.shape[1]] = positions
+        chunk['velocity'][:, :velocities.shape[1]] = velocities
+        self._chunks.append(chunk)
+
+    def records(self):
+        """ Every retired body so far, oldest first, as a RECORD array """
+        if len(self._chunks) != 1:
+            # Joined on demand, and kept joined, so adding stays cheap.
+            self._chunks = [np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=RECORD)]
+        return self._chunks[0]
+
+    def retiredMass(self, reason=None):
+        records = self.records()
+        if reason is not None:
+            records = records[records['reason'] == reason]
+        return records['mass'].sum()
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self._chunks)
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import tempfile
+
+# Bump whenever a change to the physics would change the results of an existing scenario,
+# so stale entries stop matching instead of being returned.
+CACHE_VERSION = 4
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'rochelimit')
+DEFAULT_MAX_BYTES = 64 * 2 ** 20
+
+
+def cacheKey(parameters):
+    """ A content address for a JSON-able dict of run parameters, independent of key order """
+    canonical = json.dumps({'version': CACHE_VERSION, 'parameters': parameters}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    An on-disk cache of run results, one JSON file per key.
+    Reading an entry marks it as recently used; once the directory grows past maxBytes,
+    the least recently used entries are deleted.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, maxBytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, parameters):
+        """ Returns the stored result for these parameters, or None """
+        path = self._path(cacheKey(parameters))
+        try:
+            with open(path) as f:
+                result = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        # The modification time doubles as the last-used time for eviction. If a concurrent
+        # sweep evicted the entry after it was read, the result is still good to return.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return result
+
+    def put(self, parameters, result):
+        # Written to a temporary file and renamed, so concurrent sweeps never see half an entry.
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'w') as f:
+            json.dump(result, f)
+        os.rename(temporary, self._path(cacheKey(parameters)))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for used, size, path in entries)
+        for used, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def size(self):
+        return sum(os.path.getsize(os.path.join(self.directory, name))
+                   for name in os.listdir(self.directory) if name.endswith('.json'))
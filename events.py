@@ -0,0 +1,160 @@
+import collections
+import json
+import numpy as np
+
+# Kinds of event an Environment reports. Each is edge-triggered: a body is reported
+# when it starts colliding, crossing or touching, not on every step that it stays so.
+COLLISION = 'collision'         # a body started overlapping the primary
+ROCHE_ENTRY = 'roche-entry'     # a body crossed inside Environment.rocheLimit
+ROCHE_EXIT = 'roche-exit'       # and back out again
+MERGE = 'merge'                 # two bodies came into contact
+ESCAPE = 'escape'               # a body left the width x height (x depth) bounds
+KINDS = (COLLISION, ROCHE_ENTRY, ROCHE_EXIT, MERGE, ESCAPE)
+
+MESSAGES = {
+    COLLISION: "%s hit the primary",
+    ROCHE_ENTRY: "%s crossed inside the Roche limit",
+    ROCHE_EXIT: "%s crossed back outside the Roche limit",
+    MERGE: "%s came into contact",
+    ESCAPE: "%s left the screen",
+}
+
+
+class Event:
+    """ Every body that triggered one kind of event, over one step or a coalesced run of steps """
+
+    def __init__(self, kind, time, indices, bodies):
+        self.kind = kind
+        # Simulated time of the first detection.
+        self.time = time
+        # Indices into bodies, the Environment's body list when the event was detected
+        # (or the list it was rebuilt into, while the event was held back).
+        self.indices = indices
+        self._bodies = bodies
+        # Bodies that had already left the Environment by the time the event was delivered.
+        self._departed = []
+        # How many detections were folded into this one by the rate limit.
+        self.occurrences = 1
+
+    def __len__(self):
+        return len(self._departed) + len(self.indices)
+
+    def bodies(self):
+        return self._departed + [self._bodies[index] for index in self.indices]
+
+    def _move(self, bodies, inverse=None):
+        # Re-expresses the indices in a rebuilt body list. inverse maps each old index to
+        # its new one, or -1 for bodies that went; without it, every body is taken as gone.
+        moved = np.full(len(self.indices), -1, dtype=np.int64) if inverse is None else inverse[self.indices]
+        gone = moved < 0
+        self._departed.extend(self._bodies[index] for index in np.asarray(self.indices)[gone])
+        self.indices = moved[~gone]
+        self._bodies = bodies
+
+    def message(self):
+        count = "1 body" if len(self) == 1 else "%d bodies" % len(self)
+        return MESSAGES[self.kind] % count
+
+    def record(self):
+        """ A JSON-able summary, without the body list itself """
+        return {'kind': self.kind, 'time': self.time, 'count': len(self), 'occurrences': self.occurrences}
+
+
+class EventBus:
+    """
+    Collects the events an Environment detects and hands them on to its sinks.
+
+    Every detection of one kind in one step arrives as a single Event, however many
+    bodies are involved. Detections of a kind within interval (in simulated time) of
+    the last one delivered are held back and coalesced, each body counted once, then
+    delivered together when the interval is up. So sinks see at most one event per kind
+    per interval, and the bus does a fixed amount of work per step.
+    """
+
+    def __init__(self, interval=0.0, kinds=KINDS):
+        self.interval = interval
+        self.kinds = set(kinds)
+        self.sinks = []
+        self._pending = {}
+        self._delivered = {}
+
+    def subscribe(self, sink):
+        """ Adds a sink: anything with a write(event) method """
+        self.sinks.append(sink)
+        return sink
+
+    def wants(self, kind):
+        return kind in self.kinds and bool(self.sinks)
+
+    def emit(self, kind, time, indices, bodies):
+        if not self.wants(kind) or not len(indices):
+            return
+        pending = self._pending.get(kind)
+        if pending is not None and pending._bodies is not bodies:
+            # Rebuilt without a reindex: the held bodies are kept, just not merged with these.
+            pending._move(bodies)
+
+        if pending is None:
+            self._pending[kind] = Event(kind, time, indices, bodies)
+        else:
+            # The union keeps every body once, however often it flapped in the meantime.
+            pending.indices = np.union1d(pending.indices, indices)
+            pending.occurrences += 1
+
+    def reindex(self, old, new, inverse):
+        """ Moves held events from the body list old onto its rebuild new; inverse maps each old index to its new one, or -1 """
+        for event in self._pending.values():
+            if event._bodies is old:
+                event._move(new, inverse)
+
+    def flush(self, time=None):
+        """ Delivers the held events whose interval is up, or every held event if no time is given """
+        for kind, event in list(self._pending.items()):
+            last = self._delivered.get(kind)
+            if time is None or last is None or time - last >= self.interval:
+                self._deliver(event, event.time if time is None else time)
+
+    def _deliver(self, event, time):
+        del self._pending[event.kind]
+        self._delivered[event.kind] = time
+        for sink in self.sinks:
+            sink.write(event)
+
+
+class RingSink:
+    """ Keeps the most recent events in memory """
+
+    def __init__(self, capacity=256):
+        self.events = collections.deque(maxlen=capacity)
+
+    def write(self, event):
+        self.events.append(event)
+
+
+class FileSink:
+    """ Writes each event to a file (or a path, opened for appending) as one JSON line """
+
+    def __init__(self, output):
+        self.file = open(output, 'a') if isinstance(output, str) else output
+
+    def write(self, event):
+        self.file.write(json.dumps(event.record(), sort_keys=True) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class OverlaySink:
+    """ The latest few event messages, for drawing over the simulation """
+
+    def __init__(self, lines=4, lifetime=float('inf')):
+        self.lifetime = lifetime
+        self.recent = collections.deque(maxlen=lines)
+
+    def write(self, event):
+        self.recent.append((event.time, event.message()))
+
+    def messages(self, time):
+        """ The messages still showing at this simulated time, oldest first """
+        return [message for shown, message in self.recent if time - shown < self.lifetime]
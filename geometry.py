@@ -278,6 +278,9 @@ class Vector3D:
         else:
             raise TypeError("Other must be a Vector2D")
 
+    def copy(self):
+        return Vector3D(self.x, self.y, self.z)
+
     @staticmethod
     def zero():
         return Vector3D(0, 0, 0)
@@ -1,26 +1,12 @@
-import pygame, math, random
-from roche import Environment, Body
-from geometry import Vector2D
+import math
+import sys
+from events import EventBus, FileSink, OverlaySink
+from scenario import buildScenario
 
-
-# =========== START OF SIMULATION CODE ============
+# Nothing here opens a window or imports pygame until main() runs, so the
+# physics modules and this file's constants are cheap to import headlessly.
 
 (width, height) = (1300, 700)
-screen = pygame.display.set_mode((width, height))
-pygame.display.set_icon(pygame.image.load('sigurdson_kris.png'))
-pygame.display.set_caption('Roche Limit')
-
-pygame.font.init()
-# font = pygame.font.SysFont('Sans', 60)
-
-clock = pygame.time.Clock()
-
-
-
-# Defines distance from the sides of the screen the orbit can be, in pixels.
-hmargin = 25
-vmargin = 25
-
 
 # Input Coordinates for Moon's orbit
 # Essentially the 'user input' for this simulation.
@@ -36,161 +22,153 @@ apoapsis = 5.00e7
 # input in metres from centre body's core. The Moon's perigee IRL is 3.626 * 10**8 m.
 periapsis = apoapsis
 
-# Because I have definitely input a smaller value for the apoapsis before.
-if apoapsis < periapsis:
-    apoapsis, periapsis = periapsis, apoapsis
-
-# Pixel-to-Metre conversion.
-
-# As we already defined the apoapsis, we'll use its height as our base 
-# 'kilometre unit' by which we can convert to and from pixels to metres at will.
+# percentage mass that the moon has
+MOON_FRACTION = 1
 
+# Number of fragments scattered around the Moon, sharing the mass it doesn't keep.
+N = 0
 
-m = (apoapsis + periapsis)/(float(width - 2 * hmargin)) # in m / pixel
+# Seed for scattering the fragments. Set it to replay the same cloud; None gives a new one every run.
+SEED = None
 
+# 2 for a planar simulation, 3 to let fragments leave the orbital plane.
+DIMENSIONS = 2
 
-# I have the if statement there to check if the height of the window will be too
-# small for the orbit. The program then adjusts the horizontal margin to fit
-# properly 
+# Tilt of the view in 3D, in degrees. 0 looks down onto the orbital plane.
+VIEW_INCLINATION = 0
 
-if 2 * (apoapsis * periapsis)**0.5/m > height - 2 * vmargin:
-    m = 2 * (apoapsis * periapsis)**0.5 / float(height - 2 * vmargin)
-    hmargin = abs((width - (apoapsis + periapsis)/ m )/2)
-    
+# Steps between retiring bodies that have escaped or hit the Earth,
+# for long runs. 0 keeps every body forever.
+CULL_INTERVAL = 0
 
-# This G is in pixels
-G = (6.674e-11)/m**3
+# Time between simulation steps, increase to increase speed of moon. In ms.
+dt = 100
 
-moon_radius = 1737500 / m # in km, converted to pixels
-universe = Environment((width, height))
-universe.colour = (0,0,0)
+# Time scale factor
+TIME_SCALE = 0.0001
 
-earth_radius = 6371000 / m # in metres, converted to pixels through m
-earth_mass = 5.972e24 # kg
-earth = Body((hmargin + (apoapsis / m), height / 2), earth_radius, earth_mass)
-earth.colour = (100, 100, 255) # baby blue
-universe.primary = earth
+# Events of the same kind closer together than this (in simulation time) are reported
+# together, so a swarm breaking up can't flood the terminal or the overlay.
+EVENT_INTERVAL = 10 * dt
 
-# percentage mass that the moon has
-MOON_FRACTION = 1
 
-moon_mass = 7.348e22 # kg
-centerPos = Vector2D(hmargin, height/2)
-moon = Body((centerPos.x, centerPos.y), MOON_FRACTION * moon_radius, MOON_FRACTION * moon_mass)
+def main():
+    # pygame is only needed once there is something to draw.
+    import pygame
 
-# create N bodies around the Moon
-bodies = []
-N = 0
-for i in range(N):
-    angle = random.uniform(0, 2 * math.pi)
-    radius = random.uniform(moon_radius, 1.5*moon_radius)
-    pos = centerPos + Vector2D.create_from_angle(angle, radius)
-    body = Body((pos.x, pos.y), 0.1 * moon_radius, (1 - MOON_FRACTION) / N * moon_mass)
-    bodies.append(body)
+    # =========== START OF SIMULATION CODE ============
 
+    screen = pygame.display.set_mode((width, height))
+    pygame.display.set_icon(pygame.image.load('sigurdson_kris.png'))
+    pygame.display.set_caption('Roche Limit')
 
-# Based on the periapsis and apoapsis from earlier, this will provide the Moon
-# with an initial velocity to make said orbit. We'll assume that the Moon's
-# starting location is at the apoapsis, on the left side of the screen.
+    pygame.font.init()
+    font = pygame.font.SysFont('Sans', 16)
 
-v = ((2 * m**3 * G * (earth_mass + moon_mass)) *
-    ((1 / apoapsis) - (1 / (periapsis + apoapsis))))**0.5
+    clock = pygame.time.Clock()
 
-# v = math.sqrt(m**3 * G * earth_mass/apoapsis)
+    # The pixel-to-metre conversion, G in pixels and the Moon's starting velocity are
+    # all worked out by scenario.buildScenario. Any scenario from scenarios/ can be
+    # run instead, e.g. buildScenario('eccentric-grazing').
+    setup = buildScenario({'screen': [width, height], 'apoapsis': apoapsis, 'periapsis': periapsis,
+                           'moonFraction': MOON_FRACTION, 'N': N, 'seed': SEED, 'dimensions': DIMENSIONS, 'dt': dt,
+                           'cullInterval': CULL_INTERVAL})
+    universe, G = setup.universe, setup.G
+    earth, moon = setup.primary, setup.satellite
+    universe.viewInclination = math.radians(VIEW_INCLINATION)
 
-moon.velocity = Vector2D(0, - v/m) #m/s
-for body in bodies:
-    body.velocity = Vector2D(0, - v/m) #m/s
+    # Collisions, Roche limit crossings, contacts and escapes are printed and shown on screen.
+    universe.events = EventBus(EVENT_INTERVAL)
+    universe.events.subscribe(FileSink(sys.stdout))
+    overlay = universe.events.subscribe(OverlaySink(lines=4, lifetime=50 * dt))
 
-moon.colour = (100, 100, 100)
-universe.bodies.append(moon)
-for body in bodies:
-    universe.bodies.append(body)
+    # Keeps track of times the loop has run
+    i = 0
 
-# Time between simulation steps, increase to increase speed of moon. In ms.
-dt = 100
+    # Time between drawing the trail step in frames. Large values lead to geodesic-esque patterns!
+    # Trails decimate their older points as they grow, so sampling every frame keeps
+    # the whole orbital history at a bounded drawing cost.
+    line_period = 1
 
-# Time scale factor
-TIME_SCALE = 0.0001
 
-# Keeps track of times the loop has run
-i = 0
+    running = True
+    while running:
 
-# Time between drawing the trail step in frames. Large values lead to geodesic-esque patterns!
-line_period = 5
+        i += 1
 
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    running = False
 
-running = True
-while running:
+        universe.update(G, dt)
+        screen.fill(universe.colour)
 
-    i += 1
+        # ~~~~~ Planet Trail Drawing Code ~~~~~ #
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        elif event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_ESCAPE:
-                running = False
+        # Placed prior to the planet drawing code to draw the trail underneath the planet.
 
-    universe.update(G, dt)
-    screen.fill(universe.colour)
+        # Appends the trail list with the particle's current position.
+        # For whatever reason, if these two ifs are compiled into one, everything breaks.
+        # Hence the double if. 
+        if i == line_period:
+            moon.appendTrail(height, universe.project(moon.position))
+        if i > line_period:
+            i = 0
 
-    # ~~~~~ Planet Trail Drawing Code ~~~~~ #
+        # If the trail has more than one point (necessary to actually make a line), draw the trail.
+        if len(moon.trail) > 1:
+            pygame.draw.aalines(screen, moon.line_colour, False, moon.trail.points())
 
-    # Placed prior to the planet drawing code to draw the trail underneath the planet.
+        if i == line_period:
+            universe.appendCOMTrail()
+            i = 0
 
-    # Appends the trail list with the particle's current position.
-    # For whatever reason, if these two ifs are compiled into one, everything breaks.
-    # Hence the double if. 
-    if i == line_period:
-        moon.appendTrail(height)
-    if i > line_period:
-        i = 0
+        if len(universe.trail) > 1:
+            pygame.draw.aalines(screen, (120, 255, 120), False, universe.trail.points())
 
-    # If the trail has more than one point (necessary to actually make a line), draw the trail.
-    if len(moon.trail) > 1:
-        pygame.draw.aalines(screen, moon.line_colour, False, moon.trail)
 
-    if i == line_period:
-        universe.appendCOMTrail()
-        i = 0
+        # ~~~~~ End Planet Trail Drawing Code ~~~~~ #
 
-    if len(universe.trail) > 1:
-        pygame.draw.aalines(screen, (120, 255, 120), False, universe.trail)
+        if universe.primary:
+            # Draw primary body
+            position = universe.project(universe.primary.position)
+            pygame.draw.aalines(screen, universe.primary.colour, True, universe.primary.findOutline(height, 1, position), 1)
+            pygame.draw.aalines(screen, universe.primary.colour, True, universe.primary.findOutline(height, 0, position), 1)
 
+            pygame.draw.circle(screen, universe.primary.colour, (int(position.x), height - int(position.y)), int(universe.primary.size), 0)
 
-    # ~~~~~ End Planet Trail Drawing Code ~~~~~ #
 
-    if universe.primary:
-        # Draw primary body
-        pygame.draw.aalines(screen, universe.primary.colour, True, universe.primary.findOutline(height, 1), 1)
-        pygame.draw.aalines(screen, universe.primary.colour, True, universe.primary.findOutline(height, 0), 1)
+        for p in universe.bodies:
 
-        pygame.draw.circle(screen, universe.primary.colour, (int(universe.primary.position.x), height - int(universe.primary.position.y)), int(universe.primary.size), 0)
+            # Draws it so that (0,0) is the bottom left corner
+            position = universe.project(p.position)
+            if p.size < 2:
+                pygame.draw.rect(screen, p.colour, (int(position.x), height - int(position.y), 2, 2))
+            else:
+            
+                # Draws pretty anti-aliased outlines for each body.
+                # There are two lines to make the outline a bit thicker.
+                pygame.draw.aalines(screen, p.colour, True, p.findOutline(height, 1, position), 1)
+                pygame.draw.aalines(screen, p.colour, True, p.findOutline(height, 0, position), 1)
 
+                pygame.draw.circle(screen, p.colour, (int(position.x), height - int(position.y)), int(p.size), 0)
 
-    for p in universe.bodies:
+            COM = universe.project(universe.COM)
+            pygame.draw.rect(screen, (120, 255, 120), (COM.x, height - COM.y, 5, 5), 0)
 
         # I may have got text working
-        if moon.areWeDead(earth) == True:
-            print "YOU KILLED EVERYONE!"
-
-        # Draws it so that (0,0) is the bottom left corner
-        if p.size < 2:
-            pygame.draw.rect(screen, p.colour, (int(p.position.x), height - int(p.position.y), 2, 2))
-        else:
-            
-            # Draws pretty anti-aliased outlines for each body.
-            # There are two lines to make the outline a bit thicker.
-            pygame.draw.aalines(screen, p.colour, True, p.findOutline(height, 1), 1)
-            pygame.draw.aalines(screen, p.colour, True, p.findOutline(height, 0), 1)
+        for line, message in enumerate(overlay.messages(universe.time)):
+            screen.blit(font.render(message, True, (255, 255, 255)), (10, 10 + 20 * line))
 
-            pygame.draw.circle(screen, p.colour, (int(p.position.x), height - int(p.position.y)), int(p.size), 0)
+        pygame.display.flip()
 
-        pygame.draw.rect(screen, (120, 255, 120), (universe.COM.x, height - universe.COM.y, 5, 5), 0)
+        pygame.time.delay(int(TIME_SCALE * dt * 1000))
 
-    pygame.display.flip()
+    pygame.quit()  # IDLE interpreter friendly
 
-    pygame.time.delay(int(TIME_SCALE * dt * 1000))
 
-pygame.quit()  # IDLE interpreter friendly
+if __name__ == '__main__':
+    main()
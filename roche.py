@@ -1,120 +1,606 @@
 import math
-import random
 import numpy as np
-import matplotlib.pyplot as plt
-from geometry import Vector2D
+from analytics import linkPairs
+from archive import Archive, ESCAPED, IMPACTED, NEGLIGIBLE
+from events import COLLISION, ROCHE_ENTRY, ROCHE_EXIT, MERGE, ESCAPE
+from geometry import Vector2D, Vector3D
+from trail import Trail
 
 # Gravitational Constant
 # Converted to pixels using the conversion factor from main.
 # G = (6.674*10**-11)/(124738.461538)**3 # m^3 / kg s^2
 
+# Pairwise interactions are evaluated in blocks of target rows so that the
+# temporary (rows, sources, dimensions) arrays stay around this many elements.
+CHUNK_ELEMENTS = 2 ** 20
+
+
+def _blocks(positions, sizes, sources, sourceSizes):
+    # Yields the separations of a block of target rows from every source, along with
+    # which pairs overlap. Coincident pairs (a body and itself) count as overlapping,
+    # so no branch ever divides by a zero distance.
+    rows = max(1, CHUNK_ELEMENTS // (len(sources) * positions.shape[1]))
+    for start in range(0, len(positions), rows):
+        targets = positions[start:start + rows]
+        targetSizes = sizes[start:start + rows, None]
+
+        dr = sources[None, :, :] - targets[:, None, :]
+        dist2 = np.einsum('ijk,ijk->ij', dr, dr)
+        overlap = (dist2 < (sourceSizes[None, :] + targetSizes) ** 2) | (dist2 == 0)
+        yield slice(start, start + len(targets)), targetSizes, dr, dist2, overlap
+
+
+def _inverseGasCube(sizes):
+    # 1 / size ** 3 for gas clouds, and 0 for solid bodies (which have no softened interior).
+    gas = sizes > Body.GAS_PLANET_RADIUS
+    return np.where(gas, 1.0 / np.where(gas, sizes, 1) ** 3, 0)
+
+
+def _forceFactor(dist2, overlap, targetSizes, farK, gasK, gas):
+    # The k in k * dr for each pair, with farK = G * source mass and gasK, gas describing
+    # the sources' softened interiors. All arguments broadcast against each other.
+    dist3 = np.where(overlap, 1, dist2 * np.sqrt(dist2))
+    nearK = np.where(gas, gasK, farK * _inverseGasCube(targetSizes))
+    return np.where(overlap, nearK, farK / dist3)
+
+
+def gravityAccelerations(positions, sizes, sources, sourceMasses, sourceSizes, G, neighbourRadius=None):
+    """ Vectorised Body.getGravityAcceleration: acceleration on every target from every source.
+    With a neighbourRadius (and the targets as the sources), also returns the neighbourPairs
+    found from the same separations, as (accelerations, (i, j)). """
+    accelerations = np.zeros(positions.shape)
+    first, second = [], []
+    if len(positions) and len(sources):
+        # The target's mass cancels out of the force law, so each pair contributes
+        # k * dr where k only depends on the separation and the two sizes.
+        # G * m is formed in double precision before any narrowing: G in pixel units is tiny.
+        farK = (G * sourceMasses).astype(sources.dtype)
+        gas = sourceSizes > Body.GAS_PLANET_RADIUS
+        gasK = farK * _inverseGasCube(sourceSizes)
+
+        for rows, targetSizes, dr, dist2, overlap in _blocks(positions, sizes, sources, sourceSizes):
+            k = _forceFactor(dist2, overlap, targetSizes, farK[None, :], gasK[None, :], gas[None, :])
+            # The pairs may be single precision; their sums never are.
+            for axis in range(positions.shape[1]):
+                accelerations[rows, axis] = (k * dr[:, :, axis]).sum(axis=1, dtype=np.float64)
+            if neighbourRadius is not None:
+                i, j = _nearPairs(rows, targetSizes, dist2, sourceSizes, neighbourRadius)
+                first.append(i)
+                second.append(j)
+
+    if neighbourRadius is None:
+        return accelerations
+    return accelerations, _joinPairs(first, second)
+
+
+def _nearPairs(rows, targetSizes, dist2, sourceSizes, radius):
+    # The (i, j) pairs of one block closer than radius * (size_i + size_j), leaving out
+    # each body paired with itself.
+    near = dist2 < (radius * (sourceSizes[None, :] + targetSizes)) ** 2
+    near[np.arange(rows.stop - rows.start), np.arange(rows.start, rows.stop)] = False
+    i, j = np.nonzero(near)
+    return i + rows.start, j
+
+
+def _joinPairs(first, second):
+    if not first:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def neighbourPairs(positions, sizes, radius):
+    """ Returns index arrays (i, j) of every ordered pair of distinct bodies closer than radius * (size_i + size_j) """
+    first, second = [], []
+    for rows, targetSizes, dr, dist2, overlap in _blocks(positions, sizes, positions, sizes):
+        i, j = _nearPairs(rows, targetSizes, dist2, sizes, radius)
+        first.append(i)
+        second.append(j)
+    return _joinPairs(first, second)
+
+
+def pairAccelerations(positions, sizes, masses, i, j, G):
+    """ gravityAccelerations restricted to the listed pairs: the pull of each body j on body i """
+    accelerations = np.zeros(positions.shape)
+    if not len(i):
+        return accelerations
+
+    dr = positions[j] - positions[i]
+    dist2 = np.einsum('ij,ij->i', dr, dr)
+    overlap = (dist2 < (sizes[i] + sizes[j]) ** 2) | (dist2 == 0)
+    farK = (G * masses[j]).astype(positions.dtype)
+    k = _forceFactor(dist2, overlap, sizes[i], farK, farK * _inverseGasCube(sizes[j]),
+                     sizes[j] > Body.GAS_PLANET_RADIUS)
+
+    for axis in range(positions.shape[1]):
+        accelerations[:, axis] = np.bincount(i, weights=k * dr[:, axis], minlength=len(positions))
+    return accelerations
+
+
+def gravityPotentials(positions, sizes, masses, sources, sourceMasses, sourceSizes, G, selfInteraction=False):
+    """ Vectorised Body.getPotentialEnergyWRT: each target's potential energy summed over the sources.
+    Pass selfInteraction=True when the sources are the targets, to leave out each body's own term. """
+    potentials = np.zeros(len(positions))
+    if not len(positions) or not len(sources):
+        return potentials
+
+    gas = sourceSizes > Body.GAS_PLANET_RADIUS
+    sourceInverseCube = _inverseGasCube(sourceSizes)
+
+    for rows, targetSizes, dr, dist2, overlap in _blocks(positions, sizes, sources, sourceSizes):
+        touching = sourceSizes[None, :] + targetSizes
+        dist = np.where(overlap, 1, np.sqrt(dist2))
+        near = np.where(gas[None, :], 0.5 * dist2 * sourceInverseCube[None, :],
+                        np.where(targetSizes > Body.GAS_PLANET_RADIUS, 0.5 * dist2 * _inverseGasCube(targetSizes),
+                                 1 / np.where(touching > 0, touching, 1)))
+        U = -G * sourceMasses[None, :] * np.where(overlap, near, 1 / dist)
+        if selfInteraction:
+            U[np.arange(rows.stop - rows.start), np.arange(rows.start, rows.stop)] = 0
+
+        potentials[rows] = masses[rows] * U.sum(axis=1)
+    return potentials
+
+
 class Environment:
     """ Defines the boundary of a simulation and its properties """
 
-    def __init__(self, (width, height)):
+    def __init__(self, (width, height), dimensions=2):
         self.width = width
         self.height = height
         self.colour = (255, 255, 255)
         self.primary = None
         self.bodies = []
-        self.COM = Vector2D.zero()
+
+        # 2 for the planar simulation, 3 to follow inclined and out-of-plane orbits.
+        # Bodies created with (x, y) positions are placed at z = 0 in 3D.
+        self.dimensions = dimensions
+        self.Vector = Vector3D if dimensions == 3 else Vector2D
+        # In 3D, bodies further than half this from the orbital plane (z = 0) are out of
+        # bounds, just as width and height bound x and y.
+        self.depth = max(width, height)
+
+        # Tilt of the 3D view about the horizontal screen axis, in radians.
+        # 0 looks straight down the z axis onto the x-y plane.
+        self.viewInclination = 0
+
+        self.COM = self.Vector.zero()
+        self.COMVelocity = self.Vector.zero()
         self.M = 0
-        self.trail = []
-        self.maxTrailLength = 1000
+        # Older points are progressively decimated, so the whole history stays drawable.
+        self.trail = Trail()
+
+        # Integrate positions and velocities relative to the centre of mass.
+        # The COM itself is carried separately, which keeps the integrated
+        # coordinates small and the momentum of the swarm exactly conserved.
+        self.comFrame = False
+
+        # Name of the method update uses to advance the simulation: 'verlet' or 'euler'.
+        self.integrator = 'verlet'
+
+        # Ahmad-Cohen style split of the forces between bodies, for dense swarms.
+        # Pairs closer than neighbourRadius times the sum of their sizes, where the
+        # softened interiors make the force change fastest, are recomputed every step
+        # from a neighbour list. The pull of everything further away is recomputed
+        # (along with the list) every farFieldInterval steps and extrapolated linearly
+        # in between. The primary's pull is always computed directly.
+        # An interval of 1 evaluates every pair every step.
+        self.farFieldInterval = 1
+        self.neighbourRadius = 2.0
+
+        # 'float32' halves the memory traffic of the position and velocity arrays and of
+        # the pairwise force pass, for large swarms. Forces are still summed in float64,
+        # and positions are then held relative to the primary (or the COM, with comFrame)
+        # so the small numbers keep their precision. Set it before the first update.
+        self.precision = 'float64'
+
+        # An events.EventBus that update reports collisions with the primary, Roche limit
+        # crossings, contacts and escapes to, or None to skip detecting them altogether.
+        # rocheLimit is the distance from the primary's centre counted as the Roche limit
+        # (see analytics.rocheRadii); crossings aren't reported without one.
+        self.events = None
+        self.rocheLimit = None
+        # What each body was doing at the last detection, so only changes are reported.
+        self._eventState = {}
+
+        # Long-run mode: every cullInterval steps (0 never), bodies that have left the
+        # width x height (x depth) bounds on an orbit unbound from the primary, fallen inside the
+        # primary, or weigh less than negligibleMass are retired into self.archive and
+        # dropped from self.bodies, so the step cost only follows the bodies still in play.
+        self.cullInterval = 0
+        self.negligibleMass = 0
+        self.archive = Archive()
+        self._stepsSinceCull = 0
+
+        # Simulated time of the array state.
+        self.time = 0.0
+        self._farField = None
+
+        # Array state, built from self.bodies on the first update (see reload).
+        self._packed = None
+        self.positions = None
+        self.velocities = None
+        self.accelerations = None
+        self.masses = None
+        self.sizes = None
+        self._com = None
+        self._comVelocity = None
+        self._origin = None
 
     def update(self, G, dt=0.01):
         """  Calls particle functions """
-        # Uncomment to draw COM trail
-        # self.calculateCOM(),
-
-        self.verlet(G, dt)
-        # self.euler(G, dt)
-
+        if self._packed != self.bodies:
+            self.reload()
+        if not self.bodies:
+            return
+
+        getattr(self, self.integrator)(G, dt)
+
+        if self.events is not None:
+            self.detectEvents()
+            self.events.flush(self.time)
+
+        if self.cullInterval:
+            self._stepsSinceCull += 1
+            if self._stepsSinceCull >= self.cullInterval:
+                self._stepsSinceCull = 0
+                self.cull(G)
+
+        self._writeBack()
+
+    def reload(self):
+        """ Rebuilds the array state from self.bodies. Call after editing a body by hand. """
+        old, self._packed = self._packed, list(self.bodies)
+        if self._eventState:
+            self._eventState = self._remapEventState(old, self._packed)
+        if self.primary:
+            self.primary.position = self.Vector(*self._stack([self.primary.position])[0])
+        self.masses = np.array([body.mass for body in self.bodies], dtype=float)
+        self.sizes = np.array([body.size for body in self.bodies], dtype=float)
+        self.positions = self._stack([body.position for body in self.bodies])
+        self.velocities = self._stack([body.velocity for body in self.bodies])
+        self.accelerations = self._stack([body.acceleration for body in self.bodies])
+        self._com = self._comVelocity = None
+        self._origin = None
+        self._farField = None
+        self.calculateCOM()
+
+        if self.comFrame and self.bodies:
+            self.positions -= self._com
+            self.velocities -= self._comVelocity
+        elif self.precision != 'float64' and self.primary:
+            self._origin = self._stack([self.primary.position])[0]
+            self.positions -= self._origin
+
+        precision = np.dtype(self.precision)
+        self.positions = self.positions.astype(precision)
+        self.velocities = self.velocities.astype(precision)
+        self.sizes = self.sizes.astype(precision)
 
     def calculateCOM(self):
-        # Center of mass calculation
-        self.COM = Vector2D.zero()
-        self.M = 0
-        for body in self.bodies:
-            self.M = self.M + body.mass
-            self.COM = self.COM + body.mass * body.position
-        self.COM = self.COM/self.M
+        # Center of mass calculation, from the array state.
+        if self._packed != self.bodies:
+            self.reload()
+        self.M = self.masses.sum()
+        if self.M:
+            self._com = self.masses.dot(self.getPositions()) / self.M
+            self._comVelocity = self.masses.dot(self.getVelocities()) / self.M
+        else:
+            self._com = np.zeros(self.dimensions)
+            self._comVelocity = np.zeros(self.dimensions)
+        self.COM = self.Vector(*self._com)
+        self.COMVelocity = self.Vector(*self._comVelocity)
+
+    def _stack(self, vectors):
+        # Packs vectors into an (N, dimensions) array, padding 2D vectors with z = 0.
+        state = np.zeros((len(vectors), self.dimensions))
+        for row, vector in zip(state, vectors):
+            coordinates = list(vector)
+            row[:len(coordinates)] = coordinates
+        return state
+
+    def _frameOrigin(self):
+        # Where self.positions are measured from, or None if they are absolute.
+        if self.comFrame:
+            return self._com
+        return self._origin
+
+    def getPositions(self):
+        # Absolute positions of self.bodies, whichever frame is being integrated in.
+        origin = self._frameOrigin()
+        if origin is None:
+            return self.positions
+        return self.positions + origin
+
+    def getVelocities(self):
+        if self.comFrame and self._comVelocity is not None:
+            return self.velocities + self._comVelocity
+        return self.velocities
+
+    def getEnergy(self, G):
+        """ Total kinetic plus potential energy of self.bodies, including their energy in the primary's field """
+        if self._packed != self.bodies:
+            self.reload()
+        positions = self.getPositions()
+        velocities = self.getVelocities()
+        energy = 0.5 * np.einsum('i,ij,ij->', self.masses, velocities, velocities)
+        # Each pair appears twice in the sum, once from each side.
+        energy += 0.5 * gravityPotentials(positions, self.sizes, self.masses,
+                                          positions, self.masses, self.sizes, G, selfInteraction=True).sum()
+        if self.primary:
+            energy += gravityPotentials(positions, self.sizes, self.masses, self._stack([self.primary.position]),
+                                        np.array([self.primary.mass], dtype=float),
+                                        np.array([self.primary.size], dtype=float), G).sum()
+        return energy
 
     def appendCOMTrail(self):
-        # Appends the particle's current position onto the trail list when called.
-        self.trail.append([self.COM.x, self.height - self.COM.y])
+        # Appends the particle's current position onto the trail when called.
+        COM = self.project(self.COM)
+        self.trail.append([COM.x, self.height - COM.y])
+
+    def getAccelerations(self, G):
+        # Forces only depend on separations, so they are worked out in the frame the
+        # positions are stored in, with the primary moved into that frame.
+        positions = self.positions
+        if self.farFieldInterval > 1:
+            accelerations = self._splitAccelerations(positions, G)
+        else:
+            accelerations = gravityAccelerations(positions, self.sizes, positions, self.masses, self.sizes, G)
+        if self.primary:
+            # Not in place: the split scheme keeps hold of the bodies-only accelerations.
+            primary = self._stack([self.primary.position])
+            if self._frameOrigin() is not None:
+                primary -= self._frameOrigin()
+            accelerations = accelerations + gravityAccelerations(positions, self.sizes, primary.astype(positions.dtype),
+                                                                 np.array([self.primary.mass], dtype=float),
+                                                                 np.array([self.primary.size], dtype=positions.dtype), G)
+        return accelerations
+
+    def _splitAccelerations(self, positions, G):
+        if self._farField is not None and self._farFieldAge < self.farFieldInterval:
+            # Irregular step: only the neighbours are evaluated.
+            self._farFieldAge += 1
+            near = pairAccelerations(positions, self.sizes, self.masses, self._neighbours[0], self._neighbours[1], G)
+            return near + self._farField + (self.time - self._farFieldTime) * self._farFieldRate
+
+        # Regular step: every pair, and a fresh neighbour list from the same pass.
+        total, self._neighbours = gravityAccelerations(positions, self.sizes, positions, self.masses, self.sizes, G,
+                                                       self.neighbourRadius)
+        i, j = self._neighbours
+        farField = total - pairAccelerations(positions, self.sizes, self.masses, i, j, G)
+
+        # The far field's rate of change comes from the previous regular step, split
+        # with the new neighbour list so bodies changing lists don't show up as a jump.
+        if self._farField is not None and self.time > self._farFieldTime:
+            previous = self._regularTotal - pairAccelerations(self._regularPositions, self.sizes, self.masses, i, j, G)
+            self._farFieldRate = (farField - previous) / (self.time - self._farFieldTime)
+        else:
+            self._farFieldRate = np.zeros(positions.shape)
 
-        # If the trail has exceeded a certain length, the oldest values are deleted.
-        if len(self.trail) > self.maxTrailLength:
-            self.trail.pop(0)
+        self._farField, self._farFieldTime, self._farFieldAge = farField, self.time, 1
+        self._regularTotal, self._regularPositions = total, positions.copy()
+        return total
 
-    def verlet(self, G, dt):
-        for body in self.bodies:
-            body.velocity += 0.5 * dt * body.acceleration
-            body.position += dt * body.velocity
-            body.acceleration = Vector2D.zero()
-        for i, body in enumerate(self.bodies):
-            if self.primary:
-                body.acceleration += body.getGravityAcceleration(self.primary, G)
-            for other in self.bodies[i+1:]:
-                body.acceleration += body.getGravityAcceleration(other, G)
-                other.acceleration += other.getGravityAcceleration(body, G)
-        for body in self.bodies:
-            body.velocity += 0.5 * dt * body.acceleration
+    def kick(self, dt):
+        # Advances the velocities, and the COM velocity with them, by the current accelerations.
+        comAcceleration = self.masses.dot(self.accelerations) / self.M if self.M else np.zeros(self.dimensions)
+        if self.comFrame:
+            self.velocities += dt * (self.accelerations - comAcceleration)
+        else:
+            self.velocities += dt * self.accelerations
+        self._comVelocity += dt * comAcceleration
 
-    def euler(self, G, dt):
-        for body in self.bodies:
-            body.acceleration = Vector2D.zero()
-        for i, body in enumerate(self.bodies):
-            if self.primary:
-                body.acceleration += body.getGravityAcceleration(self.primary, G)
-            for other in self.bodies[i+1:]:
-                body.acceleration += body.getGravityAcceleration(other, G)
-                other.acceleration += other.getGravityAcceleration(body, G)
-        for body in self.bodies:
-            body.velocity, body.position = body.velocity + dt * body.acceleration, body.position + dt * body.velocity
+    def drift(self, dt):
+        self.positions += dt * self.velocities
+        self._com += dt * self._comVelocity
+        self.time += dt
 
+    def verlet(self, G, dt):
+        self.kick(0.5 * dt)
+        self.drift(dt)
+        self.accelerations = self.getAccelerations(G)
+        self.kick(0.5 * dt)
 
+    def euler(self, G, dt):
+        self.accelerations = self.getAccelerations(G)
+        self.drift(dt)
+        self.kick(dt)
+
+    def detectEvents(self):
+        """ Reports every body that started a collision, Roche limit crossing, contact or escape since the last call """
+        positions = self.getPositions()
+        sizes = self.sizes.astype(float)
+        previous, state = self._eventState, {}
+        count = len(positions)
+
+        def started(name, now):
+            state[name] = now
+            before = previous.get(name)
+            return np.flatnonzero(now if before is None else now & ~before)
+
+        outside = self._outside(positions)
+        self.events.emit(ESCAPE, self.time, started('escaped', outside), self._packed)
+
+        if self.primary:
+            primary = self._stack([self.primary.position])[0]
+            distances = np.sqrt(((positions - primary) ** 2).sum(axis=1))
+            self.events.emit(COLLISION, self.time, started('colliding', distances < sizes + self.primary.size), self._packed)
+            if self.rocheLimit is not None:
+                wasInside = previous.get('inside')
+                inside = distances < self.rocheLimit
+                self.events.emit(ROCHE_ENTRY, self.time, started('inside', inside), self._packed)
+                if wasInside is not None:
+                    self.events.emit(ROCHE_EXIT, self.time, np.flatnonzero(wasInside & ~inside), self._packed)
+
+        if self.events.wants(MERGE) and count > 1:
+            # Candidate pairs come from the analytics grid, so this stays close to linear in the bodies.
+            i, j = linkPairs(positions, sizes, 2 * np.median(sizes))
+            dr = positions[i] - positions[j]
+            touching = np.einsum('ij,ij->i', dr, dr) < (sizes[i] + sizes[j]) ** 2
+            i, j = np.minimum(i[touching], j[touching]), np.maximum(i[touching], j[touching])
+            state['contacts'] = (i, j)
+            new = np.ones(len(i), dtype=bool)
+            if 'contacts' in previous:
+                before = previous['contacts']
+                new = ~np.in1d(i * count + j, before[0] * count + before[1], assume_unique=True)
+            self.events.emit(MERGE, self.time, np.union1d(i[new], j[new]), self._packed)
+
+        self._eventState = state
+
+    def _outside(self, positions):
+        # Which positions lie beyond the width x height (x depth, in 3D) bounds.
+        outside = ((positions[:, 0] < 0) | (positions[:, 0] > self.width) |
+                   (positions[:, 1] < 0) | (positions[:, 1] > self.height))
+        if self.dimensions == 3:
+            outside |= np.abs(positions[:, 2]) > 0.5 * self.depth
+        return outside
+
+    def _remapEventState(self, old, new):
+        # Carries each body's event state across a reload, so keeping or reordering
+        # bodies doesn't report them all over again. New bodies start with a clean slate.
+        # Events the bus is still holding back are moved onto the new list too.
+        index = dict((id(body), n) for n, body in enumerate(old or []))
+        mapping = np.array([index.get(id(body), -1) for body in new], dtype=np.int64)
+        kept = mapping >= 0
+        inverse = np.full(len(old or []), -1, dtype=np.int64)
+        inverse[mapping[kept]] = np.flatnonzero(kept)
+        if self.events is not None and old:
+            self.events.reindex(old, new, inverse)
+
+        state = {}
+        for name, value in self._eventState.items():
+            if name == 'contacts':
+                i, j = inverse[value[0]], inverse[value[1]]
+                both = (i >= 0) & (j >= 0)
+                state[name] = (np.minimum(i[both], j[both]), np.maximum(i[both], j[both]))
+            elif len(value):
+                state[name] = np.where(kept, value[np.where(kept, mapping, 0)], False)
+            else:
+                # Nothing was being tracked (every body had gone), so nothing carries over.
+                state[name] = np.zeros(len(new), dtype=bool)
+        return state
+
+    def cull(self, G):
+        """ Retires escaped, impacted and negligible bodies (see cullInterval) and returns how many went """
+        if self._packed != self.bodies:
+            self.reload()
+        positions, velocities = self.getPositions(), self.getVelocities()
+        reasons = np.zeros(len(positions), dtype=np.int8)
+        reasons[self.masses < self.negligibleMass] = NEGLIGIBLE
+
+        outside = self._outside(positions)
+        if self.primary:
+            # A body that is only off screen for part of its orbit is kept.
+            dr = positions - self._stack([self.primary.position])[0]
+            distances = np.sqrt(np.einsum('ij,ij->i', dr, dr))
+            speeds2 = np.einsum('ij,ij->i', velocities, velocities)
+            unbound = 0.5 * speeds2 > G * self.primary.mass / np.where(distances > 0, distances, 1)
+            reasons[outside & unbound] = ESCAPED
+            reasons[distances < self.primary.size] = IMPACTED
+        else:
+            reasons[outside] = ESCAPED
+
+        retired = reasons != 0
+        if retired.any():
+            self.archive.add(self.time, reasons[retired], self.masses[retired], self.sizes[retired],
+                             positions[retired], velocities[retired])
+            self._compact(~retired)
+        return retired.sum()
+
+    def _compact(self, keep):
+        # Drops bodies from self.bodies and the array state together, without a full reload.
+        old = self._packed
+        self.bodies[:] = [body for body, kept in zip(old, keep) if kept]
+        self._packed = list(self.bodies)
+        if self._eventState:
+            self._eventState = self._remapEventState(old, self._packed)
+
+        self.masses = self.masses[keep]
+        self.sizes = self.sizes[keep]
+        self.positions = self.positions[keep]
+        self.velocities = self.velocities[keep]
+        self.accelerations = self.accelerations[keep]
+        # The neighbour list indexes the old arrays; the next step starts a fresh split.
+        self._farField = None
+
+        # The survivors' centre of mass has moved, so in the COM frame they are re-centred on it.
+        com, comVelocity = self._com, self._comVelocity
+        self.calculateCOM()
+        if self.comFrame:
+            self.positions += (com - self._com).astype(self.positions.dtype)
+            self.velocities += (comVelocity - self._comVelocity).astype(self.velocities.dtype)
+
+    def _writeBack(self):
+        # Copies the array state back onto the Body objects for drawing.
+        for body, position, velocity, acceleration in zip(self.bodies, self.getPositions().tolist(),
+                                                          self.getVelocities().tolist(), self.accelerations.tolist()):
+            body.position = self.Vector(*position)
+            body.velocity = self.Vector(*velocity)
+            body.acceleration = self.Vector(*acceleration)
+        self.COM = self.Vector(*self._com)
+        self.COMVelocity = self.Vector(*self._comVelocity)
+
+    # The physics never sees the screen: 3D state is only flattened here, when drawing.
+    def project(self, position):
+        """ Returns the Vector2D at which a position appears in the (tilted) view """
+        if not isinstance(position, Vector3D):
+            return position
+        centre = 0.5 * self.height
+        cos, sin = math.cos(self.viewInclination), math.sin(self.viewInclination)
+        return Vector2D(position.x, centre + (position.y - centre) * cos - position.z * sin)
+
+    def projectPositions(self):
+        """ The same projection as project, for the whole (N, dimensions) position array at once """
+        positions = self.getPositions()
+        if self.dimensions != 3:
+            return positions
+        centre = 0.5 * self.height
+        cos, sin = math.cos(self.viewInclination), math.sin(self.viewInclination)
+        return np.column_stack((positions[:, 0], centre + (positions[:, 1] - centre) * cos - positions[:, 2] * sin))
 
 
 class Body:
-    """ A circular planet with a velocity, size and density """
+    """ A circular (or, given (x, y, z), spherical) planet with a velocity, size and density """
 
     # If the body has a radius greater than this, the body is treated as a gas cloud
     GAS_PLANET_RADIUS = 5
 
-    def __init__(self, (x, y), size, mass):
-        self.position = Vector2D(x, y)
+    def __init__(self, position, size, mass):
+        # position may be a tuple, a list or a vector.
+        coordinates = list(position)
+        if len(coordinates) not in (2, 3):
+            raise ValueError("A body's position needs 2 or 3 coordinates, not %d" % len(coordinates))
+        Vector = Vector3D if len(coordinates) == 3 else Vector2D
+        self.position = Vector(*coordinates)
         self.size = size
         self.colour = (255, 255, 255)
         self.line_colour = (255, 0, 0)
         self.thickness = 0
         self.mass = mass
-        self.velocity = Vector2D.zero()
-        self.acceleration = Vector2D.zero()
+        self.velocity = Vector.zero()
+        self.acceleration = Vector.zero()
         self.fixed = False
-        self.trail = []
-        self.maxTrailLength = 1200
+        self.trail = Trail()
 
     
     # Used to find the points necessary to draw the planet trails. 
-    def appendTrail(self, height):
+    # In 3D, pass the projected position from Environment.project.
+    def appendTrail(self, height, position=None):
+        if position is None:
+            position = self.position
         # Obviously fixed planets do not need trails.
         if not self.fixed:
-            # Appends the particle's current position onto the trail list when called.
-            self.trail.append([self.position.x, height - self.position.y])
-
-            # If the trail has exceeded a certain length, the oldest values are deleted.
-            if len(self.trail) > self.maxTrailLength:
-                self.trail.pop(0)
+            # Appends the particle's current position onto the trail when called.
+            # The Trail decimates older points itself, so nothing is ever thrown away.
+            self.trail.append([position.x, height - position.y])
 
     # Finds a series of points every around the outline of a planet to give it a nice anti-aliased outline.
-    def findOutline(self, height, scale):
+    def findOutline(self, height, scale, position=None):
+        if position is None:
+            position = self.position
         # Defines how many degrees we should insert a line. Decrease to decrease performance.
         step = 2
         edge = []
         for n in range(0, int(360/step)):
-            edge.append([self.position.x + (self.size - scale) * math.cos(math.pi * n * step / 180), height - (self.position.y + (self.size - scale) * math.sin(math.pi * n * step / 180))])
+            edge.append([position.x + (self.size - scale) * math.cos(math.pi * n * step / 180), height - (position.y + (self.size - scale) * math.sin(math.pi * n * step / 180))])
         return edge
 
     def areWeDead(self, other):
@@ -126,7 +612,7 @@ class Body:
 
     def getGravityAcceleration(self, other, G):  # this isn't where this function should go
         if other is None:
-            return Vector2D.zero()
+            return self.position.zero()
 
         dr = other.position - self.position
         dist = dr.length()
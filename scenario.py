@@ -0,0 +1,329 @@
+import json
+import math
+import os
+import random
+import time
+from analytics import DisruptionMonitor, rocheRadii
+from cache import ResultCache
+from roche import Environment, Body
+from geometry import Vector2D
+
+SCENARIO_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios')
+BASELINE = os.path.join(SCENARIO_DIRECTORY, 'baseline.json')
+
+# Every scenario starts from these and overrides what it needs. Distances, radii
+# and masses are in metres and kilograms; dt is in simulation units, as in main.py.
+DEFAULTS = {
+    'name': 'custom',
+    'description': '',
+    'screen': [1300, 700],
+    'dimensions': 2,
+    'integrator': 'verlet',
+    'comFrame': True,
+
+    # The apoapsis (apogee in Earth-Moon system) is the highest point in an orbit,
+    # the periapsis (perigee) the lowest, both in metres from the centre body's core.
+    'apoapsis': 5.00e7,
+    'periapsis': 5.00e7,
+
+    'primaryRadius': 6371000,
+    'primaryMass': 5.972e24,
+    'satelliteRadius': 1737500,
+    'satelliteMass': 7.348e22,
+
+    # Fraction of the satellite's mass kept in its core. The rest is split evenly
+    # between N fragments scattered around it.
+    'moonFraction': 1,
+    'N': 0,
+
+    # Seeds the fragment placement. With a seed, a scenario always builds the same
+    # system and its results can be cached; None scatters the fragments differently each run.
+    'seed': None,
+
+    # See Environment.farFieldInterval; 1 evaluates every pair every step.
+    'farFieldInterval': 1,
+    'neighbourRadius': 2.0,
+
+    # See Environment.precision: 'float64', or 'float32' for large swarms.
+    'precision': 'float64',
+
+    # Long-run mode, see Environment.cullInterval; 0 keeps every body. Retired bodies
+    # take their energy with them, so the energy drift of such runs isn't comparable.
+    'cullInterval': 0,
+    'negligibleMass': 0,
+
+    'dt': 100,
+    'steps': 1000,
+
+    # The most energy drift --check accepts, whatever the baseline. None allows up to
+    # DRIFT_TOLERANCE times the baseline's drift instead.
+    'maxEnergyDrift': None,
+}
+
+# Throughput may fall this far below the baseline before check fails. Energy drift may
+# grow to this many times the baseline (or the absolute floor, for near-zero baselines),
+# unless the scenario sets its own maxEnergyDrift.
+SPEED_TOLERANCE = 0.5
+DRIFT_TOLERANCE = 10.0
+DRIFT_FLOOR = 1e-9
+
+# A fixed reference run, timed alongside every result. Throughput is checked against the
+# baseline in units of this run's speed, so a baseline recorded on one machine holds on another.
+CALIBRATION = {'apoapsis': 1.2e7, 'periapsis': 1.2e7, 'moonFraction': 0, 'seed': 1, 'N': 200, 'dt': 20}
+CALIBRATION_STEPS = 20
+
+
+class Setup:
+    """ Everything built from a scenario: the Environment plus the values needed to run and draw it """
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.universe = None
+        self.primary = None
+        self.satellite = None
+        self.fragments = []
+        self.G = None
+        self.dt = scenario['dt']
+        self.m = None
+
+
+def listScenarios():
+    return sorted(name[:-len('.json')] for name in os.listdir(SCENARIO_DIRECTORY)
+                  if name.endswith('.json') and name != os.path.basename(BASELINE))
+
+
+def loadScenario(scenario):
+    """ Accepts a library name, a path to a JSON file or a dict, and returns the full scenario dict """
+    if not isinstance(scenario, dict):
+        path = scenario if os.path.exists(scenario) else os.path.join(SCENARIO_DIRECTORY, scenario + '.json')
+        with open(path) as f:
+            scenario = json.load(f)
+        scenario.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+
+    unknown = set(scenario) - set(DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown scenario keys: %s" % ', '.join(sorted(unknown)))
+
+    full = dict(DEFAULTS)
+    full.update(scenario)
+    return full
+
+
+def buildScenario(scenario):
+    """ Builds the Earth/satellite system a scenario describes, in pixel units """
+    scenario = loadScenario(scenario)
+    setup = Setup(scenario)
+    (width, height) = scenario['screen']
+
+    # Defines distance from the sides of the screen the orbit can be, in pixels.
+    hmargin = 25
+    vmargin = 25
+
+    apoapsis, periapsis = scenario['apoapsis'], scenario['periapsis']
+    # Because I have definitely input a smaller value for the apoapsis before.
+    if apoapsis < periapsis:
+        apoapsis, periapsis = periapsis, apoapsis
+
+    # Pixel-to-Metre conversion. The whole orbit is fitted across the window,
+    # then shrunk further if it would be too tall for it.
+    m = (apoapsis + periapsis) / float(width - 2 * hmargin)  # in m / pixel
+    if 2 * (apoapsis * periapsis) ** 0.5 / m > height - 2 * vmargin:
+        m = 2 * (apoapsis * periapsis) ** 0.5 / float(height - 2 * vmargin)
+        hmargin = abs((width - (apoapsis + periapsis) / m) / 2)
+    setup.m = m
+
+    # This G is in pixels
+    setup.G = G = 6.674e-11 / m ** 3
+
+    universe = Environment((width, height), scenario['dimensions'])
+    universe.colour = (0, 0, 0)
+    universe.integrator = scenario['integrator']
+    universe.comFrame = scenario['comFrame']
+    universe.farFieldInterval = scenario['farFieldInterval']
+    universe.neighbourRadius = scenario['neighbourRadius']
+    universe.precision = scenario['precision']
+    universe.cullInterval = scenario['cullInterval']
+    universe.negligibleMass = scenario['negligibleMass']
+    setup.universe = universe
+
+    earth = Body((hmargin + (apoapsis / m), height / 2.0), scenario['primaryRadius'] / m, scenario['primaryMass'])
+    earth.colour = (100, 100, 255)  # baby blue
+    universe.primary = setup.primary = earth
+
+    fraction = float(scenario['moonFraction'])
+    moon_radius = scenario['satelliteRadius'] / m
+    moon_mass = scenario['satelliteMass']
+    centerPos = Vector2D(hmargin, height / 2.0)
+    # The whole satellite's fluid limit, which is where a rubble pile starts to come apart.
+    universe.rocheLimit = float(rocheRadii(scenario['primaryMass'], moon_mass, moon_radius)[1])
+
+    moon = Body((centerPos.x, centerPos.y), fraction * moon_radius, fraction * moon_mass)
+    moon.colour = (100, 100, 100)
+    setup.satellite = moon
+
+    # create N bodies around the Moon
+    rng = random.Random(scenario['seed'])
+    N = scenario['N']
+    for i in range(N):
+        angle = rng.uniform(0, 2 * math.pi)
+        radius = rng.uniform(moon_radius, 1.5 * moon_radius)
+        pos = centerPos + Vector2D.create_from_angle(angle, radius)
+        if scenario['dimensions'] == 3:
+            # Scatter the cloud out of the orbital plane too.
+            position = (pos.x, pos.y, rng.uniform(-0.5, 0.5) * moon_radius)
+        else:
+            position = (pos.x, pos.y)
+        setup.fragments.append(Body(position, 0.1 * moon_radius, (1 - fraction) / N * moon_mass))
+
+    # Start at the apoapsis, on the left side of the screen, with the speed for the requested orbit.
+    v = ((2 * m ** 3 * G * (scenario['primaryMass'] + moon_mass)) *
+         ((1 / apoapsis) - (1 / (periapsis + apoapsis)))) ** 0.5
+    for body in [moon] + setup.fragments:
+        body.velocity = Vector2D(0, - v / m)
+        universe.bodies.append(body)
+
+    return setup
+
+
+def runParameters(scenario, steps):
+    # Everything that determines a run's outcome, for cache.ResultCache. The name and
+    # description are left out so identical runs filed under different names share an entry.
+    parameters = dict(scenario, steps=steps)
+    del parameters['name'], parameters['description'], parameters['maxEnergyDrift']
+    return parameters
+
+
+def calibrate(repeats=3):
+    """ Steps per second of the CALIBRATION run on this machine, the best of a few tries """
+    best = 0.0
+    for attempt in range(repeats):
+        setup = buildScenario(CALIBRATION)
+        start = time.time()
+        for step in range(CALIBRATION_STEPS):
+            setup.universe.update(setup.G, setup.dt)
+        best = max(best, CALIBRATION_STEPS / (time.time() - start))
+    return best
+
+
+def runScenario(scenario, steps=None, cache=None):
+    """
+    Runs a scenario headlessly and returns its throughput, energy drift and disruption time.
+    Given a cache.ResultCache, seeded runs that have been done before are returned from it
+    (throughput included, so don't benchmark through a cache).
+    """
+    scenario = loadScenario(scenario)
+    steps = scenario['steps'] if steps is None else steps
+    cacheable = cache is not None and scenario['seed'] is not None
+    if cacheable:
+        result = cache.get(runParameters(scenario, steps))
+        if result is not None:
+            result['name'] = scenario['name']
+            return result
+
+    setup = buildScenario(scenario)
+    universe, G, dt = setup.universe, setup.G, setup.dt
+
+    E0 = universe.getEnergy(G)
+    monitor = DisruptionMonitor(universe)
+    monitor.update()
+
+    # Only the integration itself is timed, not the breakup detection.
+    elapsed = 0.0
+    for step in range(steps):
+        start = time.time()
+        universe.update(G, dt)
+        elapsed += time.time() - start
+
+        if monitor.onset is None:
+            monitor.update()
+
+    E1 = universe.getEnergy(G)
+    result = {
+        'name': scenario['name'],
+        'bodies': len(universe.bodies),
+        'steps': steps,
+        'stepsPerSecond': steps / elapsed if elapsed else float('inf'),
+        'energyDrift': abs((E1 - E0) / E0) if E0 else abs(E1 - E0),
+        'disruptionTime': monitor.onset,
+    }
+    if cacheable:
+        cache.put(runParameters(scenario, steps), result)
+    return result
+
+
+def checkResults(results, baseline, calibration=None, driftLimits=None):
+    """
+    Returns a list of regressions of results against baseline, both keyed by scenario name.
+    Given this machine's calibrate() speed, throughput is compared relative to the calibration
+    recorded with each baseline result. driftLimits maps names to absolute energy drift bounds.
+    """
+    driftLimits = driftLimits or {}
+    failures = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        if result['steps'] != expected['steps']:
+            failures.append("%s: ran %d steps, the baseline ran %d" % (name, result['steps'], expected['steps']))
+            continue
+        speed = expected['stepsPerSecond']
+        if calibration and expected.get('calibration'):
+            speed *= calibration / expected['calibration']
+        if result['stepsPerSecond'] < (1 - SPEED_TOLERANCE) * speed:
+            failures.append("%s: %.1f steps/s, baseline %.1f on this machine" % (name, result['stepsPerSecond'], speed))
+        limit = driftLimits.get(name)
+        if limit is None:
+            limit = max(DRIFT_TOLERANCE * expected['energyDrift'], DRIFT_FLOOR)
+        if result['energyDrift'] > limit:
+            failures.append("%s: energy drift %.3g, limit %.3g" % (name, result['energyDrift'], limit))
+        if (result['disruptionTime'] is None) != (expected['disruptionTime'] is None):
+            failures.append("%s: disruption time %s, baseline %s" % (name, result['disruptionTime'], expected['disruptionTime']))
+    return failures
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Run the scenario library headlessly.')
+    parser.add_argument('names', nargs='*', help='scenarios to run (default: all)')
+    parser.add_argument('--steps', type=int, help='override every scenario\'s step count')
+    parser.add_argument('--seed', type=int, help='override every scenario\'s fragment seed')
+    parser.add_argument('--cache', metavar='DIRECTORY', help='reuse results of identical seeded runs from this directory')
+    parser.add_argument('--check', action='store_true', help='fail if results regress against the baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='record these results as the new baseline')
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache) if args.cache else None
+    calibration = calibrate()
+    print "%-24s %22.1f steps/s" % ('calibration', calibration)
+
+    results = {}
+    driftLimits = {}
+    for name in args.names or listScenarios():
+        scenario = loadScenario(name)
+        if args.seed is not None:
+            scenario['seed'] = args.seed
+        result = runScenario(scenario, args.steps, cache)
+        # Recorded with each result, so re-recording part of the baseline keeps the rest valid.
+        result['calibration'] = calibration
+        results[result['name']] = result
+        driftLimits[result['name']] = scenario['maxEnergyDrift']
+        print "%-24s %6d bodies %8.1f steps/s  drift %.3g  disrupted at %s" % (
+            result['name'], result['bodies'], result['stepsPerSecond'], result['energyDrift'], result['disruptionTime'])
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE):
+            with open(BASELINE) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True, separators=(',', ': '))
+
+    if args.check:
+        with open(BASELINE) as f:
+            failures = checkResults(results, json.load(f), calibration, driftLimits)
+        for failure in failures:
+            print failure
+        sys.exit(1 if failures else 0)
@@ -0,0 +1,319 @@
+import asyncore
+import json
+import os
+import socket
+import struct
+import numpy as np
+from roche import Environment, Body
+
+# Every message the server sends is framed as (kind, payload length) followed by the payload.
+FRAME = struct.Struct('!BI')
+REPLY = 1   # payload is a JSON object answering one command
+STATE = 2   # payload is a binary state frame, see encodeState
+
+# (name length, step, simulated time, body count, dimensions), then the name,
+# the body positions and the COM as big-endian float32.
+STATE_HEADER = struct.Struct('!HQdIB')
+
+# Commands arrive as one JSON object per line. Longer lines are a broken client.
+MAX_COMMAND_LENGTH = 65536
+
+
+def encodeState(name, simulation):
+    name = name.encode('utf-8')
+    universe = simulation.universe
+    if universe._packed != universe.bodies:
+        universe.reload()
+    positions = universe.getPositions()
+    payload = (STATE_HEADER.pack(len(name), simulation.steps, simulation.time, len(positions), universe.dimensions) +
+               name + positions.astype('>f4').tobytes() + np.array(list(universe.COM)).astype('>f4').tobytes())
+    return FRAME.pack(STATE, len(payload)) + payload
+
+
+def decodeState(payload):
+    """ Returns (name, step, time, positions, COM) from a STATE payload """
+    nameLength, step, time, count, dimensions = STATE_HEADER.unpack_from(payload)
+    offset = STATE_HEADER.size
+    name = payload[offset:offset + nameLength]
+    state = np.frombuffer(payload, dtype='>f4', offset=offset + nameLength).astype(float)
+    return name, step, time, state[:count * dimensions].reshape(count, dimensions), state[count * dimensions:]
+
+
+class Simulation:
+    """ An Environment hosted by the server, along with its clock and its viewers """
+
+    def __init__(self, universe, G, dt):
+        self.universe = universe
+        self.G = G
+        self.dt = dt
+        self.paused = False
+        self.steps = 0
+        self.time = 0.0
+        self.subscribers = set()
+
+    def step(self, count=1):
+        for i in range(count):
+            self.universe.update(self.G, self.dt)
+            self.steps += 1
+            self.time += self.dt
+
+
+class Connection(asyncore.dispatcher):
+    """ One client: reads commands, writes replies and the latest state frame """
+
+    def __init__(self, sock, server):
+        asyncore.dispatcher.__init__(self, sock, map=server.map)
+        self.server = server
+        self.incoming = ''
+        self.outgoing = ''
+        # Only the newest state frame is kept per client. A viewer that can't keep up
+        # skips frames rather than growing a backlog or holding up the physics loop.
+        self.pendingFrame = None
+
+    def publish(self, frame):
+        self.pendingFrame = frame
+
+    def reply(self, message):
+        payload = json.dumps(message)
+        self.outgoing += FRAME.pack(REPLY, len(payload)) + payload
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return bool(self.outgoing) or self.pendingFrame is not None
+
+    def handle_read(self):
+        data = self.recv(4096)
+        if not data:
+            return
+        self.incoming += data
+        while '\n' in self.incoming:
+            line, self.incoming = self.incoming.split('\n', 1)
+            if line.strip():
+                self.reply(self.server.handleCommand(self, line))
+        if len(self.incoming) > MAX_COMMAND_LENGTH:
+            self.close()
+
+    def handle_write(self):
+        # Replies go out ahead of state frames, and a frame is only taken once the
+        # previous message has been fully written, so frames are never interleaved.
+        if not self.outgoing and self.pendingFrame is not None:
+            self.outgoing, self.pendingFrame = self.pendingFrame, None
+        sent = self.send(self.outgoing)
+        self.outgoing = self.outgoing[sent:]
+
+    def handle_close(self):
+        for simulation in self.server.simulations.values():
+            simulation.subscribers.discard(self)
+        self.close()
+
+
+class SimulationServer(asyncore.dispatcher):
+    """ Hosts Environments and serves them to local clients.
+
+    address is either a (host, port) tuple or the path of a Unix socket.
+    The physics runs in the same loop as the sockets, between polls, so a
+    single run can be watched by any number of clients.
+    """
+
+    def __init__(self, address):
+        self.map = {}
+        asyncore.dispatcher.__init__(self, map=self.map)
+        self.simulations = {}
+        self.running = False
+
+        # How many steps a running simulation advances per loop, and how many loops pass between frames.
+        self.stepsPerTick = 1
+        self.ticksPerFrame = 1
+        self.ticks = 0
+
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.remove(address)
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+        self.bind(address)
+        self.address = self.socket.getsockname()
+        self.listen(5)
+
+    def host(self, name, universe, G, dt):
+        self.simulations[name] = Simulation(universe, G, dt)
+        return self.simulations[name]
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            Connection(pair[0], self)
+
+    def tick(self, timeout=0.0):
+        running = [simulation for simulation in self.simulations.values() if not simulation.paused]
+        for simulation in running:
+            simulation.step(self.stepsPerTick)
+
+        self.ticks += 1
+        if self.ticks >= self.ticksPerFrame:
+            self.ticks = 0
+            for name, simulation in self.simulations.items():
+                if simulation.subscribers and not simulation.paused:
+                    self.broadcast(name, simulation)
+
+        # Only sleep waiting for commands when there is no physics to get on with.
+        asyncore.loop(timeout=0.0 if running else timeout, map=self.map, count=1)
+
+    def broadcast(self, name, simulation):
+        # Encoded once per simulation, however many viewers there are.
+        frame = encodeState(name, simulation)
+        for connection in simulation.subscribers:
+            connection.publish(frame)
+
+    def serve(self):
+        self.running = True
+        while self.running:
+            self.tick(timeout=0.05)
+        self.shutdown()
+
+    def shutdown(self):
+        for connection in self.map.values():
+            connection.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def handleCommand(self, connection, line):
+        try:
+            message = json.loads(line)
+            if not isinstance(message, dict):
+                raise ValueError("Commands must be JSON objects")
+            command = message.get('command')
+            handler = getattr(self, 'command_' + str(command), None)
+            if handler is None:
+                raise ValueError("Unknown command: %s" % command)
+            name = message.get('simulation', 'default')
+            if command != 'list' and name not in self.simulations:
+                raise KeyError("No simulation named %s" % name)
+            reply = handler(connection, name, message) or {}
+        except (ValueError, KeyError, TypeError) as error:
+            return {'ok': False, 'error': str(error)}
+        reply['ok'] = True
+        return reply
+
+    # ~~~~~ Commands ~~~~~ #
+    # Each takes the connection, the simulation name and the decoded message,
+    # and returns the fields to send back.
+
+    def command_list(self, connection, name, message):
+        return {'simulations': sorted(self.simulations)}
+
+    def command_pause(self, connection, name, message):
+        self.simulations[name].paused = True
+
+    def command_resume(self, connection, name, message):
+        self.simulations[name].paused = False
+
+    def command_step(self, connection, name, message):
+        simulation = self.simulations[name]
+        simulation.step(int(message.get('count', 1)))
+        if simulation.subscribers:
+            self.broadcast(name, simulation)
+        return {'steps': simulation.steps}
+
+    def command_dt(self, connection, name, message):
+        self.simulations[name].dt = float(message['dt'])
+
+    def command_add(self, connection, name, message):
+        universe = self.simulations[name].universe
+        # Checked here, so a bad body is turned away instead of failing the next step for everyone.
+        position = [float(coordinate) for coordinate in message['position']]
+        if len(position) > universe.dimensions:
+            raise ValueError("Position has %d coordinates, the simulation has %d dimensions" % (len(position), universe.dimensions))
+        body = Body(position, float(message['size']), float(message['mass']))
+        if 'velocity' in message:
+            velocity = [float(component) for component in message['velocity']]
+            if len(velocity) != len(position):
+                raise ValueError("Velocity has %d components, the position has %d" % (len(velocity), len(position)))
+            body.velocity = body.position.__class__(*velocity)
+        universe.bodies.append(body)
+        return {'count': len(universe.bodies)}
+
+    def command_state(self, connection, name, message):
+        simulation = self.simulations[name]
+        universe = simulation.universe
+        return {'steps': simulation.steps, 'time': simulation.time, 'dt': simulation.dt,
+                'paused': simulation.paused, 'count': len(universe.bodies), 'M': float(universe.M),
+                'COM': list(universe.COM), 'COMVelocity': list(universe.COMVelocity),
+                'positions': [list(body.position) for body in universe.bodies],
+                'velocities': [list(body.velocity) for body in universe.bodies]}
+
+    def command_subscribe(self, connection, name, message):
+        self.simulations[name].subscribers.add(connection)
+
+    def command_unsubscribe(self, connection, name, message):
+        self.simulations[name].subscribers.discard(connection)
+
+
+class Client:
+    """ A blocking client for SimulationServer, for scripts and viewers """
+
+    def __init__(self, address, timeout=10.0):
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(address)
+        self.buffer = ''
+        self.frames = []
+
+    def command(self, command, **arguments):
+        """ Sends a command and returns its reply. State frames received meanwhile are kept for frame(). """
+        arguments['command'] = command
+        self.socket.sendall(json.dumps(arguments) + '\n')
+        while True:
+            kind, payload = self._receive()
+            if kind == REPLY:
+                return json.loads(payload)
+            self.frames.append(payload)
+
+    def frame(self):
+        """ Returns the next state frame as (name, step, time, positions, COM) """
+        while not self.frames:
+            kind, payload = self._receive()
+            if kind == STATE:
+                self.frames.append(payload)
+        return decodeState(self.frames.pop(0))
+
+    def close(self):
+        self.socket.close()
+
+    def _receive(self):
+        while True:
+            if len(self.buffer) >= FRAME.size:
+                kind, length = FRAME.unpack_from(self.buffer)
+                if len(self.buffer) >= FRAME.size + length:
+                    payload = self.buffer[FRAME.size:FRAME.size + length]
+                    self.buffer = self.buffer[FRAME.size + length:]
+                    return kind, payload
+            data = self.socket.recv(65536)
+            if not data:
+                raise socket.error("Connection closed by server")
+            self.buffer += data
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve Roche limit simulations to local clients.')
+    parser.add_argument('--unix', help='path of the Unix socket to listen on')
+    parser.add_argument('--port', type=int, default=7412, help='localhost TCP port, if --unix is not given')
+    parser.add_argument('--G', type=float, default=1.0, help='gravitational constant, in simulation units')
+    parser.add_argument('--dt', type=float, default=0.01)
+    parser.add_argument('--dimensions', type=int, default=2, choices=(2, 3))
+    args = parser.parse_args()
+
+    server = SimulationServer(args.unix or ('127.0.0.1', args.port))
+    # Starts empty; clients populate it with the add command.
+    server.host('default', Environment((1300, 700), args.dimensions), args.G, args.dt)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,92 @@
+import unittest
+import numpy as np
+import analytics
+import roche
+from geometry import Vector2D
+
+
+class TestRocheRadii(unittest.TestCase):
+
+    def testEarthMoon(self):
+        # The textbook figures: about 9 500 km for a rigid Moon and 18 400 km for a fluid one.
+        rigid, fluid = analytics.rocheRadii(5.972e24, 7.348e22, 1737.5)
+        self.assertAlmostEqual(rigid, 9482, delta=10)
+        self.assertAlmostEqual(fluid, 18381, delta=20)
+
+    def testVectorisedAndMassless(self):
+        rigid, fluid = analytics.rocheRadii(8.0, np.array([1.0, 0.0]), np.array([2.0, 2.0]))
+        self.assertAlmostEqual(rigid[0], 2 * 16 ** (1 / 3.0))
+        self.assertAlmostEqual(fluid[0], 2.44 * 4)
+        self.assertEqual(rigid[1], np.inf)
+
+
+class TestClusters(unittest.TestCase):
+
+    def testLinkPairsMatchBruteForce(self):
+        rng = np.random.RandomState(0)
+        for dimensions in (2, 3):
+            positions = rng.uniform(0, 50, (400, dimensions))
+            sizes = rng.choice([0, 0.5, 1, 6], 400)
+            i, j = analytics.linkPairs(positions, sizes, 2.0)
+
+            dist = np.sqrt(((positions[:, None] - positions[None]) ** 2).sum(axis=2))
+            expected = np.nonzero(np.triu(dist < np.maximum(2.0, sizes[:, None] + sizes[None]), 1))
+            self.assertEqual(sorted(zip(np.minimum(i, j), np.maximum(i, j))), sorted(zip(*expected)))
+
+    def testClusterLabels(self):
+        # A chain linked out of order, a pair and a loner.
+        labels = analytics.clusterLabels(7, np.array([4, 3, 1, 5]), np.array([3, 1, 0, 6]))
+        self.assertEqual(list(labels), [0, 0, 2, 0, 0, 5, 5])
+
+    def testHubWithTheHighestIndex(self):
+        # Every spoke linked to one hub listed last: a handful of passes, not one per spoke.
+        spokes = 2000
+        labels, passes = analytics._unionFind(spokes + 1, np.arange(spokes), np.full(spokes, spokes))
+        self.assertTrue((labels == 0).all())
+        self.assertTrue(passes <= 3)
+
+    def testFindClusters(self):
+        universe = roche.Environment((1300, 700))
+        universe.primary = roche.Body((0, 0), 30, 1000.0)
+        for x, y, mass in [(100, 0, 1), (101.5, 0, 1), (103, 0, 1), (200, 0, 0.5)]:
+            universe.bodies.append(roche.Body((x, y), 1, mass))
+
+        clusters = analytics.findClusters(universe)
+        self.assertEqual(len(clusters), 2)
+        self.assertEqual(list(clusters.labels), [0, 0, 0, 1])
+        self.assertEqual(list(clusters.masses), [3, 0.5])
+        self.assertAlmostEqual(clusters.distances[0], 101.5)
+        self.assertAlmostEqual(clusters.radii[1], 1)
+        rigid, fluid = analytics.rocheRadii(1000.0, 3, clusters.radii[0])
+        self.assertAlmostEqual(clusters.rigidLimits[0], rigid)
+        self.assertEqual(list(clusters.insideFluidLimit()), list(clusters.distances < clusters.fluidLimits))
+
+
+class TestDisruptionMonitor(unittest.TestCase):
+
+    def splitChain(self, primary, steps=7):
+        # A chain of touching bodies whose links all stretch past touching at t = 0.625.
+        universe = roche.Environment((1300, 700))
+        universe.primary = primary
+        for index in range(4):
+            body = roche.Body((100 + 1.5 * index, 0), 1, 1)
+            body.velocity = Vector2D(0.8 * index, 0)
+            universe.bodies.append(body)
+
+        monitor = analytics.DisruptionMonitor(universe)
+        monitor.update()
+        for step in range(steps):
+            universe.update(0, 0.1)
+            monitor.update()
+        return monitor
+
+    def testOnsetWhenTheSwarmSplits(self):
+        # Fragments of unit density come apart within about 244 of this primary.
+        primary = roche.Body((0, 0), 30, 1.0e6)
+        self.assertEqual(self.splitChain(primary, steps=6).onset, None)
+        self.assertAlmostEqual(self.splitChain(primary).onset, 0.7)
+
+    def testNoOnsetOutsideTheLimit(self):
+        # The same split, but well beyond this primary's fluid limit, or with no primary at all.
+        self.assertEqual(self.splitChain(roche.Body((0, 0), 30, 1.0)).onset, None)
+        self.assertEqual(self.splitChain(None).onset, None)
@@ -0,0 +1,89 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import cache
+import scenario
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = cache.ResultCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testKeyIgnoresOrder(self):
+        self.assertEqual(cache.cacheKey({'a': 1, 'b': 2.5}), cache.cacheKey({'b': 2.5, 'a': 1}))
+        self.assertNotEqual(cache.cacheKey({'a': 1}), cache.cacheKey({'a': 2}))
+
+    def testRoundTrip(self):
+        self.assertEqual(self.cache.get({'dt': 100}), None)
+        self.cache.put({'dt': 100}, {'energyDrift': 1e-6})
+        self.assertEqual(self.cache.get({'dt': 100}), {'energyDrift': 1e-6})
+
+    def testEvictsLeastRecentlyUsed(self):
+        result = {'padding': 'x' * 1000}
+        self.cache.maxBytes = 2500
+        self.cache.put({'run': 1}, result)
+        self.cache.put({'run': 2}, result)
+
+        # Make run 1 the most recently used before run 3 pushes the cache over its limit.
+        past = time.time() - 100
+        os.utime(os.path.join(self.directory, cache.cacheKey({'run': 2}) + '.json'), (past, past))
+        os.utime(os.path.join(self.directory, cache.cacheKey({'run': 1}) + '.json'), (past + 10, past + 10))
+        self.cache.get({'run': 1})
+        self.cache.put({'run': 3}, result)
+
+        self.assertNotEqual(self.cache.get({'run': 1}), None)
+        self.assertEqual(self.cache.get({'run': 2}), None)
+        self.assertNotEqual(self.cache.get({'run': 3}), None)
+        self.assertTrue(self.cache.size() <= 2500)
+
+    def testEvictedWhileReading(self):
+        self.cache.put({'dt': 100}, {'energyDrift': 1e-6})
+
+        # Another sweep removes the entry between the read and the touch.
+        def evicted(path, times):
+            os.remove(path)
+            raise OSError(2, 'No such file or directory', path)
+        utime = os.utime
+        os.utime = evicted
+        try:
+            self.assertEqual(self.cache.get({'dt': 100}), {'energyDrift': 1e-6})
+        finally:
+            os.utime = utime
+
+
+class TestDeterministicRuns(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testSeedReproducesFragments(self):
+        first = scenario.buildScenario({'moonFraction': 0.5, 'N': 20, 'seed': 7})
+        second = scenario.buildScenario({'moonFraction': 0.5, 'N': 20, 'seed': 7})
+        other = scenario.buildScenario({'moonFraction': 0.5, 'N': 20, 'seed': 8})
+        self.assertEqual([list(body.position) for body in first.fragments],
+                         [list(body.position) for body in second.fragments])
+        self.assertNotEqual([list(body.position) for body in first.fragments],
+                            [list(body.position) for body in other.fragments])
+
+    def testSeededRunsAreCached(self):
+        results = cache.ResultCache(self.directory)
+        run = {'name': 'first', 'moonFraction': 0.5, 'N': 5, 'seed': 3, 'steps': 20}
+        first = scenario.runScenario(run, cache=results)
+        # Same parameters under another name share the entry, throughput and all.
+        second = scenario.runScenario(dict(run, name='second'), cache=results)
+        self.assertEqual(second['stepsPerSecond'], first['stepsPerSecond'])
+        self.assertEqual(second['name'], 'second')
+
+        scenario.runScenario(dict(run, dt=50), cache=results)
+        scenario.runScenario(dict(run, seed=None), cache=results)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
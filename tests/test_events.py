@@ -0,0 +1,133 @@
+import unittest
+import json
+import StringIO
+import numpy as np
+import events
+import roche
+from geometry import Vector2D
+
+
+def makeUniverse(interval=0.0):
+    universe = roche.Environment((100, 100))
+    universe.primary = roche.Body((50, 50), 10, 1000.0)
+    universe.events = events.EventBus(interval)
+    ring = universe.events.subscribe(events.RingSink())
+    return universe, ring
+
+
+class TestEventBus(unittest.TestCase):
+
+    def testCoalescesWithinInterval(self):
+        bus = events.EventBus(interval=1.0)
+        ring = bus.subscribe(events.RingSink())
+        bodies = ['a', 'b', 'c']
+        for time, indices in [(0.0, [0]), (0.4, [0, 1]), (0.8, [1]), (1.2, [2])]:
+            bus.emit(events.ESCAPE, time, np.array(indices), bodies)
+            bus.flush(time)
+
+        self.assertEqual(len(ring.events), 2)
+        first, second = ring.events
+        self.assertEqual(first.bodies(), ['a'])
+        self.assertEqual(list(second.indices), [0, 1, 2])
+        self.assertEqual(second.occurrences, 3)
+        self.assertEqual(second.message(), "3 bodies left the screen")
+
+    def testNewBodyListDoesNotBypassInterval(self):
+        bus = events.EventBus(interval=1.0)
+        ring = bus.subscribe(events.RingSink())
+        bus.emit(events.ESCAPE, 0.0, np.array([0]), ['a'])
+        bus.flush(0.0)
+        bus.emit(events.ESCAPE, 0.2, np.array([0]), ['b'])
+        bus.flush(0.2)
+        bus.emit(events.ESCAPE, 0.4, np.array([1]), ['c', 'd'])
+        bus.flush(0.4)
+        self.assertEqual(len(ring.events), 1)
+        bus.flush(1.0)
+        self.assertEqual(ring.events[1].bodies(), ['b', 'd'])
+
+    def testSinks(self):
+        bus = events.EventBus(kinds=[events.COLLISION])
+        output = StringIO.StringIO()
+        bus.subscribe(events.FileSink(output))
+        overlay = bus.subscribe(events.OverlaySink(lines=1, lifetime=5))
+        bus.emit(events.COLLISION, 1.0, np.array([3]), range(4))
+        bus.emit(events.MERGE, 1.0, np.array([1, 2]), range(4))
+        bus.flush()
+
+        self.assertEqual(json.loads(output.getvalue()), {'kind': 'collision', 'time': 1.0, 'count': 1, 'occurrences': 1})
+        self.assertEqual(overlay.messages(2.0), ["1 body hit the primary"])
+        self.assertEqual(overlay.messages(10.0), [])
+
+
+class TestEnvironmentEvents(unittest.TestCase):
+
+    def testIntervalHoldsAcrossRebuilds(self):
+        # Bodies added (and culled) every step rebuild the body list every step.
+        universe, ring = makeUniverse(interval=1.0)
+        universe.cullInterval = 1
+        for step in range(15):
+            for y in (10, 20):
+                body = roche.Body((-5, y), 1, 1)
+                body.velocity = Vector2D(-1, 0)
+                universe.bodies.append(body)
+            universe.update(0, 0.1)
+
+        # The first escape goes out at once, the next eleven steps' are held until t = 1.2.
+        escapes = [event for event in ring.events if event.kind == events.ESCAPE]
+        self.assertEqual([len(event) for event in escapes], [2, 22])
+        self.assertAlmostEqual(escapes[1].time, 0.2)
+        self.assertEqual(len(set(escapes[1].bodies())), 22)
+        self.assertEqual(universe.bodies, [])
+
+
+    def testCollisionReportedOnce(self):
+        universe, ring = makeUniverse()
+        universe.bodies.append(roche.Body((55, 50), 1, 1))
+        for step in range(5):
+            universe.update(0, 0.1)
+        self.assertEqual([event.kind for event in ring.events], [events.COLLISION])
+
+    def testRocheCrossingsAndEscape(self):
+        universe, ring = makeUniverse()
+        universe.rocheLimit = 20
+        body = roche.Body((75, 50), 1, 1)
+        body.velocity = Vector2D(-10, 0)
+        universe.bodies.append(body)
+        for step in range(10):
+            universe.update(0, 1)
+        kinds = [event.kind for event in ring.events]
+        self.assertEqual(kinds, [events.ROCHE_ENTRY, events.COLLISION, events.ROCHE_EXIT, events.ESCAPE])
+        self.assertEqual([event.time for event in ring.events], [1, 2, 5, 8])
+
+    def testContactsSurviveReload(self):
+        universe, ring = makeUniverse()
+        for x in [10, 11, 30]:
+            universe.bodies.append(roche.Body((x, 10), 1, 1))
+        universe.update(0, 0.1)
+        self.assertEqual([(event.kind, list(event.indices)) for event in ring.events], [(events.MERGE, [0, 1])])
+
+        # Rebuilding the arrays doesn't report the same contact again, only the new one.
+        universe.bodies.insert(0, roche.Body((30.5, 10), 1, 1))
+        universe.update(0, 0.1)
+        self.assertEqual(len(ring.events), 2)
+        self.assertEqual([body.position.x for body in ring.events[1].bodies()], [30.5, 30])
+
+    def testRepopulatingAfterEveryBodyWent(self):
+        universe, ring = makeUniverse()
+        universe.cullInterval = 1
+        body = roche.Body((5, 50), 1, 1)
+        body.velocity = Vector2D(-100, 0)
+        universe.bodies.append(body)
+        universe.update(0.01, 0.1)
+        self.assertEqual(universe.bodies, [])
+
+        universe.bodies.append(roche.Body((55, 50), 1, 1))
+        universe.update(0.01, 0.1)
+        self.assertEqual([event.kind for event in ring.events], [events.ESCAPE, events.COLLISION])
+
+        # Emptied by hand rather than by culling.
+        universe.bodies[:] = []
+        universe.update(0.01, 0.1)
+        universe.bodies.append(roche.Body((10, 10), 1, 1))
+        universe.update(0.01, 0.1)
+        self.assertEqual(len(universe.positions), 1)
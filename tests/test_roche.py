@@ -0,0 +1,302 @@
+import unittest
+import math
+import random
+import numpy as np
+import archive
+import roche
+from geometry import Vector2D, Vector3D
+
+
+def makeUniverse(n=12, seed=1, dimensions=2):
+    # A small, dense cluster orbiting a gaseous primary so both force branches are exercised.
+    rng = random.Random(seed)
+    universe = roche.Environment((1300, 700), dimensions)
+    universe.primary = roche.Body((650, 350), 30, 5.0e4)
+    for i in range(n):
+        body = roche.Body((rng.uniform(100, 200), rng.uniform(300, 400)), rng.choice([1, 8]), rng.uniform(1, 10))
+        body.velocity = Vector2D(rng.uniform(-1, 1), rng.uniform(-3, -1))
+        universe.bodies.append(body)
+    return universe
+
+
+class TestEnvironment(unittest.TestCase):
+
+    G = 0.01
+
+    def testAccelerationsMatchBody(self):
+        universe = makeUniverse()
+        universe.reload()
+        actual = universe.getAccelerations(self.G)
+
+        for i, body in enumerate(universe.bodies):
+            expected = body.getGravityAcceleration(universe.primary, self.G)
+            for other in universe.bodies:
+                if other is not body and (other.position - body.position).length() > 0:
+                    expected += body.getGravityAcceleration(other, self.G)
+            self.assertAlmostEqual(actual[i][0], expected.x)
+            self.assertAlmostEqual(actual[i][1], expected.y)
+
+    def testCOMTrackedDuringIntegration(self):
+        universe = makeUniverse()
+        for step in range(50):
+            universe.update(self.G, 0.1)
+
+        tracked = universe.COM.copy()
+        trackedVelocity = universe.COMVelocity.copy()
+        universe.calculateCOM()
+        self.assertAlmostEqual(tracked.x, universe.COM.x)
+        self.assertAlmostEqual(tracked.y, universe.COM.y)
+        self.assertAlmostEqual(trackedVelocity.x, universe.COMVelocity.x)
+        self.assertAlmostEqual(trackedVelocity.y, universe.COMVelocity.y)
+        self.assertAlmostEqual(universe.M, sum(body.mass for body in universe.bodies))
+
+    def testCalculateCOMFromBodies(self):
+        universe = makeUniverse(n=3)
+        universe.calculateCOM()
+        self.assertAlmostEqual(universe.M, sum(body.mass for body in universe.bodies))
+        universe.bodies.append(roche.Body((10, 10), 1, 100))
+        universe.calculateCOM()
+        self.assertAlmostEqual(universe.M, sum(body.mass for body in universe.bodies))
+        expected = sum(body.mass * body.position.x for body in universe.bodies) / universe.M
+        self.assertAlmostEqual(universe.COM.x, expected)
+
+    def testCOMFrameMatchesFixedFrame(self):
+        fixed = makeUniverse()
+        comFrame = makeUniverse()
+        comFrame.comFrame = True
+        for step in range(50):
+            fixed.update(self.G, 0.1)
+            comFrame.update(self.G, 0.1)
+
+        for a, b in zip(fixed.bodies, comFrame.bodies):
+            self.assertAlmostEqual(a.position.x, b.position.x, places=6)
+            self.assertAlmostEqual(a.position.y, b.position.y, places=6)
+        self.assertAlmostEqual(fixed.COM.x, comFrame.COM.x, places=6)
+
+    def testAddingBodyRebuildsState(self):
+        universe = makeUniverse(n=3)
+        universe.update(self.G, 0.1)
+        universe.bodies.append(roche.Body((10, 10), 1, 100))
+        universe.update(self.G, 0.1)
+        self.assertEqual(len(universe.positions), 4)
+        self.assertAlmostEqual(universe.M, sum(body.mass for body in universe.bodies))
+
+    def testEnergyMatchesBody(self):
+        universe = makeUniverse()
+        expected = 0
+        for body in universe.bodies:
+            expected += body.getKineticEnergy() + body.getPotentialEnergyWRT(universe.primary, self.G)
+            for other in universe.bodies:
+                expected += 0.5 * body.getPotentialEnergyWRT(other, self.G)
+        self.assertAlmostEqual(universe.getEnergy(self.G), expected)
+
+    def testEulerIntegrator(self):
+        universe = makeUniverse(n=1)
+        body = universe.bodies[0]
+        position, velocity = body.position.copy(), body.velocity.copy()
+        universe.integrator = 'euler'
+        universe.update(self.G, 0.1)
+
+        expected = position + 0.1 * velocity
+        self.assertAlmostEqual(body.position.x, expected.x)
+        self.assertAlmostEqual(body.position.y, expected.y)
+
+
+class TestNeighbourScheme(unittest.TestCase):
+
+    G = 0.01
+
+    def testNeighbourPairs(self):
+        universe = makeUniverse()
+        universe.reload()
+        i, j = roche.neighbourPairs(universe.positions, universe.sizes, 2.0)
+        pairs = set(zip(i, j))
+
+        for a, body in enumerate(universe.bodies):
+            for b, other in enumerate(universe.bodies):
+                near = a != b and (body.position - other.position).length() < 2.0 * (body.size + other.size)
+                self.assertEqual((a, b) in pairs, near)
+
+    def testNeighboursFromTheGravityPass(self):
+        universe = makeUniverse()
+        universe.reload()
+        chunk, roche.CHUNK_ELEMENTS = roche.CHUNK_ELEMENTS, 16
+        try:
+            # Several blocks of rows, so the pairs are offset by each block's first row.
+            accelerations, (i, j) = roche.gravityAccelerations(universe.positions, universe.sizes, universe.positions,
+                                                               universe.masses, universe.sizes, self.G, 2.0)
+            expected = roche.gravityAccelerations(universe.positions, universe.sizes, universe.positions,
+                                                  universe.masses, universe.sizes, self.G)
+            pairs = roche.neighbourPairs(universe.positions, universe.sizes, 2.0)
+        finally:
+            roche.CHUNK_ELEMENTS = chunk
+        self.assertTrue(np.array_equal(accelerations, expected))
+        self.assertEqual(sorted(zip(i, j)), sorted(zip(*pairs)))
+
+    def testAllPairsMatchesFullKernel(self):
+        universe = makeUniverse()
+        universe.reload()
+        n = len(universe.bodies)
+        i, j = [a for a in range(n) for b in range(n)], [b for a in range(n) for b in range(n)]
+        actual = roche.pairAccelerations(universe.positions, universe.sizes, universe.masses, np.array(i), np.array(j), self.G)
+        expected = roche.gravityAccelerations(universe.positions, universe.sizes, universe.positions,
+                                              universe.masses, universe.sizes, self.G)
+        self.assertTrue(np.allclose(actual, expected))
+
+    def testSplitAccelerationsStayClose(self):
+        exact = makeUniverse(n=30)
+        split = makeUniverse(n=30)
+        split.farFieldInterval = 4
+        for step in range(20):
+            exact.update(self.G, 0.1)
+            split.update(self.G, 0.1)
+
+        error = np.abs(split.accelerations - exact.accelerations).max()
+        self.assertTrue(error < 1e-3 * np.abs(exact.accelerations).max())
+        self.assertTrue(np.abs(split.getPositions() - exact.getPositions()).max() < 1e-3)
+
+
+class TestSinglePrecision(unittest.TestCase):
+
+    G = 0.01
+
+    def simulate(self, precision, comFrame=False, steps=200):
+        universe = makeUniverse(n=30)
+        universe.precision = precision
+        universe.comFrame = comFrame
+        universe.reload()
+        E0 = universe.getEnergy(self.G)
+        for step in range(steps):
+            universe.update(self.G, 0.1)
+        return universe, (universe.getEnergy(self.G) - E0) / abs(E0)
+
+    def testStateIsSingleAndSumsAreDouble(self):
+        universe, drift = self.simulate('float32', steps=1)
+        self.assertEqual(universe.positions.dtype, np.float32)
+        self.assertEqual(universe.velocities.dtype, np.float32)
+        self.assertEqual(universe.accelerations.dtype, np.float64)
+        self.assertEqual(universe.getPositions().dtype, np.float64)
+
+    def testPositionsHeldRelativeToPrimary(self):
+        universe, drift = self.simulate('float32', steps=1)
+        primary = np.array(list(universe.primary.position))
+        self.assertTrue(np.allclose(universe.positions + primary, universe.getPositions()))
+
+    def testEnergyDriftBoundedByDoublePrecision(self):
+        double, doubleDrift = self.simulate('float64')
+        for comFrame in (False, True):
+            single, singleDrift = self.simulate('float32', comFrame)
+            self.assertTrue(abs(singleDrift - doubleDrift) < 1e-5)
+            self.assertTrue(np.abs(single.getPositions() - double.getPositions()).max() < 1e-2)
+
+
+class TestLongRun(unittest.TestCase):
+
+    G = 0.01
+
+    def testRetiresEscapedImpactedAndNegligible(self):
+        universe = makeUniverse(n=4)
+        impacted, escaping, wandering, light = universe.bodies[:4]
+        impacted.position = Vector2D(655, 350)
+        escaping.position, escaping.velocity = Vector2D(-5, 350), Vector2D(-100, 0)
+        # Off screen, but still bound to the primary.
+        wandering.position, wandering.velocity = Vector2D(-5, 350), Vector2D(0, 0.1)
+        light.mass = 1e-9
+        universe.negligibleMass = 1e-6
+        universe.cullInterval = 2
+
+        universe.update(self.G, 0.1)
+        self.assertEqual(len(universe.bodies), 4)
+        universe.update(self.G, 0.1)
+        self.assertEqual(universe.bodies, [wandering])
+        self.assertEqual(len(universe.positions), 1)
+        self.assertAlmostEqual(universe.M, wandering.mass)
+
+        records = universe.archive.records()
+        self.assertEqual(list(records['reason']), [archive.IMPACTED, archive.ESCAPED, archive.NEGLIGIBLE])
+        self.assertAlmostEqual(records['time'][0], 0.2)
+        self.assertAlmostEqual(universe.archive.retiredMass(archive.ESCAPED), escaping.mass)
+        self.assertTrue(records['position'][1][0] < -5)
+
+    def testRetiresBodiesLeavingThePlaneIn3D(self):
+        universe = roche.Environment((1300, 700), dimensions=3)
+        universe.primary = roche.Body((650, 350, 0), 30, 5.0e4)
+        leaving = roche.Body((650, 350, 15000), 1, 1)
+        leaving.velocity = roche.Vector3D(0, 0, 1000)
+        # Above the plane too, but within the depth bounds.
+        staying = roche.Body((650, 350, 300), 1, 1)
+        universe.bodies.extend([leaving, staying])
+        universe.cullInterval = 1
+        universe.update(self.G, 0.1)
+
+        self.assertEqual(universe.bodies, [staying])
+        self.assertEqual(list(universe.archive.records()['reason']), [archive.ESCAPED])
+
+    def testCullingMatchesDroppingTheBodies(self):
+        for comFrame, precision in [(False, 'float64'), (True, 'float64'), (False, 'float32')]:
+            culled = makeUniverse(n=12)
+            culled.bodies[3].position = Vector2D(650, 352)
+            culled.comFrame, culled.precision = comFrame, precision
+            culled.update(self.G, 0.1)
+            self.assertEqual(culled.cull(self.G), 1)
+
+            # The survivors carry on just as if the body had never been there.
+            fresh = makeUniverse(n=0)
+            fresh.comFrame, fresh.precision = comFrame, precision
+            for body in culled.bodies:
+                copy = roche.Body(tuple(body.position), body.size, body.mass)
+                copy.velocity, copy.acceleration = body.velocity.copy(), body.acceleration.copy()
+                fresh.bodies.append(copy)
+            fresh.reload()
+            for step in range(20):
+                culled.update(self.G, 0.1)
+                fresh.update(self.G, 0.1)
+            self.assertTrue(np.allclose(culled.getPositions(), fresh.getPositions()))
+            self.assertTrue(np.allclose(culled.getVelocities(), fresh.getVelocities()))
+            self.assertAlmostEqual(culled.COM.x, fresh.COM.x)
+
+
+class TestEnvironment3D(unittest.TestCase):
+
+    G = 0.01
+
+    def testPlanarRunMatches2D(self):
+        flat = makeUniverse()
+        solid = makeUniverse(dimensions=3)
+        for step in range(20):
+            flat.update(self.G, 0.1)
+            solid.update(self.G, 0.1)
+
+        self.assertEqual(solid.positions.shape, (12, 3))
+        for a, b in zip(flat.bodies, solid.bodies):
+            self.assertAlmostEqual(a.position.x, b.position.x)
+            self.assertAlmostEqual(a.position.y, b.position.y)
+            self.assertEqual(b.position.z, 0)
+
+    def testBodyFromVector(self):
+        self.assertEqual(list(roche.Body(Vector2D(1, 2), 1, 1).position), [1, 2])
+        self.assertEqual(list(roche.Body(Vector3D(1, 2, 3), 1, 1).position), [1, 2, 3])
+        self.assertRaises(ValueError, roche.Body, (1,), 1, 1)
+        self.assertRaises(ValueError, roche.Body, (1, 2, 3, 4), 1, 1)
+
+    def testOutOfPlaneForce(self):
+        universe = roche.Environment((1300, 700), dimensions=3)
+        universe.primary = roche.Body((650, 350, 0), 30, 5.0e4)
+        body = roche.Body((650, 350, 100), 1, 1)
+        universe.bodies.append(body)
+        universe.update(self.G, 0.1)
+
+        self.assertEqual(body.acceleration.x, 0)
+        self.assertEqual(body.acceleration.y, 0)
+        self.assertAlmostEqual(body.acceleration.z, -self.G * 5.0e4 / 100 ** 2)
+
+    def testProjection(self):
+        universe = roche.Environment((1300, 700), dimensions=3)
+        universe.viewInclination = math.pi / 2
+        universe.bodies.append(roche.Body((10, 350, 20), 1, 1))
+        universe.reload()
+
+        projected = universe.project(universe.bodies[0].position)
+        self.assertAlmostEqual(projected.x, 10)
+        self.assertAlmostEqual(projected.y, 350 - 20)
+        self.assertAlmostEqual(universe.projectPositions()[0][1], projected.y)
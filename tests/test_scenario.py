@@ -0,0 +1,65 @@
+import unittest
+import math
+import scenario
+
+
+class TestScenario(unittest.TestCase):
+
+    def testLibraryLoads(self):
+        names = scenario.listScenarios()
+        for name in ['circular-outside', 'circular-inside', 'eccentric-grazing', 'rubble-pile-1k', 'rubble-pile-10k']:
+            self.assertIn(name, names)
+            self.assertEqual(scenario.loadScenario(name)['name'], name)
+
+    def testUnknownKeysRejected(self):
+        self.assertRaises(ValueError, scenario.loadScenario, {'apogee': 1e7})
+
+    def testCircularOrbitSpeed(self):
+        setup = scenario.buildScenario({'apoapsis': 5.0e7, 'periapsis': 5.0e7})
+        moon, earth = setup.satellite, setup.primary
+        r = (earth.position - moon.position).length()
+        expected = math.sqrt(setup.G * (earth.mass + moon.mass) / r)
+        self.assertAlmostEqual(moon.velocity.length(), expected)
+        self.assertAlmostEqual(r * setup.m, 5.0e7, delta=1)
+
+    def testFragmentsShareTheMoonsMass(self):
+        setup = scenario.buildScenario({'moonFraction': 0.25, 'N': 10})
+        self.assertEqual(len(setup.universe.bodies), 11)
+        self.assertAlmostEqual(sum(body.mass for body in setup.universe.bodies) / 7.348e22, 1)
+
+    def testRun(self):
+        result = scenario.runScenario('eccentric-grazing', steps=100)
+        self.assertEqual(result['steps'], 100)
+        self.assertTrue(result['stepsPerSecond'] > 0)
+        self.assertTrue(result['energyDrift'] < 1e-4)
+        self.assertEqual(result['disruptionTime'], None)
+
+    def testCheckResults(self):
+        baseline = {'a': {'steps': 10, 'stepsPerSecond': 100.0, 'energyDrift': 1e-6, 'disruptionTime': None}}
+        self.assertEqual(scenario.checkResults({'a': dict(baseline['a'], stepsPerSecond=90.0)}, baseline), [])
+
+        slow = dict(baseline['a'], stepsPerSecond=10.0)
+        drifting = dict(baseline['a'], energyDrift=1e-3)
+        disrupted = dict(baseline['a'], disruptionTime=500)
+        for result in [slow, drifting, disrupted]:
+            self.assertEqual(len(scenario.checkResults({'a': result}, baseline)), 1)
+
+    def testCheckScalesSpeedByCalibration(self):
+        # Recorded on a machine twice as fast as this one.
+        baseline = {'a': {'steps': 10, 'stepsPerSecond': 100.0, 'energyDrift': 0.3, 'disruptionTime': None,
+                          'calibration': 200.0}}
+        result = dict(baseline['a'], stepsPerSecond=45.0)
+        self.assertEqual(scenario.checkResults({'a': result}, baseline, calibration=100.0), [])
+        self.assertEqual(len(scenario.checkResults({'a': result}, baseline, calibration=200.0)), 1)
+
+        # An absolute drift bound replaces the relative one.
+        drifting = dict(baseline['a'], energyDrift=0.6)
+        self.assertEqual(scenario.checkResults({'a': drifting}, baseline, calibration=200.0), [])
+        self.assertEqual(len(scenario.checkResults({'a': drifting}, baseline, 200.0, {'a': 0.5})), 1)
+
+    def testOnlyInsideLimitComesApart(self):
+        # The same seeded pile, inside and outside the fluid limit.
+        inside = scenario.runScenario('circular-inside', steps=80)
+        outside = scenario.runScenario('circular-outside', steps=80)
+        self.assertTrue(inside['disruptionTime'] is not None)
+        self.assertEqual(outside['disruptionTime'], None)
@@ -0,0 +1,98 @@
+import unittest
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import roche
+import server
+
+
+class TestSimulationServer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = server.SimulationServer(os.path.join(self.directory, 'roche.sock'))
+
+        universe = roche.Environment((1300, 700))
+        universe.primary = roche.Body((650, 350), 30, 5.0e4)
+        moon = roche.Body((150, 350), 3, 10)
+        moon.velocity = roche.Vector2D(0, -1)
+        universe.bodies.append(moon)
+        self.simulation = self.server.host('default', universe, 0.01, 0.1)
+        self.simulation.paused = True
+
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.start()
+        self.client = server.Client(self.server.address)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.running = False
+        self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def testStepAndQuery(self):
+        self.assertEqual(self.client.command('list')['simulations'], ['default'])
+        self.assertEqual(self.client.command('step', count=3)['steps'], 3)
+
+        state = self.client.command('state')
+        self.assertEqual(state['steps'], 3)
+        self.assertAlmostEqual(state['time'], 0.3)
+        self.assertEqual(state['positions'][0], list(self.simulation.universe.bodies[0].position))
+
+    def testChangeDtAndAddBody(self):
+        self.assertTrue(self.client.command('dt', dt=0.5)['ok'])
+        self.assertEqual(self.client.command('add', position=[100, 100], size=1, mass=2, velocity=[1, 0])['count'], 2)
+        self.client.command('step')
+
+        state = self.client.command('state')
+        self.assertEqual(state['count'], 2)
+        self.assertEqual(state['dt'], 0.5)
+
+    def testErrors(self):
+        reply = self.client.command('explode')
+        self.assertFalse(reply['ok'])
+        reply = self.client.command('pause', simulation='missing')
+        self.assertFalse(reply['ok'])
+
+        # Bodies that don't fit the simulation are refused, and it carries on stepping.
+        self.assertFalse(self.client.command('add', position=[1, 2, 3], size=1, mass=1)['ok'])
+        self.assertFalse(self.client.command('add', position=[1, 2], size=1, mass=1, velocity=[1, 0, 0])['ok'])
+        self.assertFalse(self.client.command('add', position=['a', 2], size=1, mass=1)['ok'])
+        self.assertEqual(self.client.command('step')['steps'], 1)
+
+        # As is valid JSON that isn't a command object.
+        self.client.socket.sendall('[1]\n')
+        kind, payload = self.client._receive()
+        self.assertFalse(json.loads(payload)['ok'])
+        self.assertEqual(self.client.command('state')['count'], 1)
+
+    def testSubscribersReceiveFrames(self):
+        self.client.command('subscribe')
+        self.client.command('resume')
+        name, step, time, positions, COM = self.client.frame()
+
+        self.assertEqual(name, 'default')
+        self.assertTrue(step > 0)
+        self.assertEqual(positions.shape, (1, 2))
+        self.assertAlmostEqual(positions[0][0], COM[0], places=3)
+
+
+class TestConnection(unittest.TestCase):
+
+    def testSlowClientOnlyKeepsLatestFrame(self):
+        simulationServer = server.SimulationServer(('127.0.0.1', 0))
+        ours, theirs = socket.socketpair()
+        connection = server.Connection(ours, simulationServer)
+        for frame in ['first', 'second', 'third']:
+            connection.publish(frame)
+        self.assertEqual(connection.pendingFrame, 'third')
+
+        connection.handle_write()
+        self.assertEqual(theirs.recv(100), 'third')
+        self.assertFalse(connection.writable())
+
+        simulationServer.shutdown()
+        theirs.close()
@@ -0,0 +1,31 @@
+import unittest
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Wall-clock budget, in seconds, for a fresh interpreter to import everything a
+# headless worker needs. Sweeps spin up hundreds of these, so keep it small.
+STARTUP_BUDGET = 0.5
+
+HEADLESS = 'import roche, scenario, server, main'
+
+
+def spawn(code):
+    start = time.time()
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+    return time.time() - start, output
+
+
+class TestStartup(unittest.TestCase):
+
+    def testHeavyModulesStayUnloaded(self):
+        elapsed, output = spawn(HEADLESS + '; import sys; print(sorted(m for m in ("matplotlib", "pygame") if m in sys.modules))')
+        self.assertEqual(output.strip(), '[]')
+
+    def testStartupBudget(self):
+        # Best of three, so a busy machine doesn't fail the test on one slow spawn.
+        elapsed = min(spawn(HEADLESS)[0] for i in range(3))
+        self.assertTrue(elapsed < STARTUP_BUDGET, "Headless startup took %.3fs, budget %.3fs" % (elapsed, STARTUP_BUDGET))
@@ -0,0 +1,52 @@
+import unittest
+import math
+import trail
+
+
+class TestSimplify(unittest.TestCase):
+
+    def testStraightLine(self):
+        points = [[x, 2 * x] for x in range(50)]
+        self.assertEqual(trail.simplify(points, 0.1), [[0, 0], [49, 98]])
+
+    def testKeepsCorners(self):
+        points = [[x, 0] for x in range(10)] + [[9, y] for y in range(1, 10)]
+        self.assertEqual(trail.simplify(points, 0.1), [[0, 0], [9, 0], [9, 9]])
+
+    def testWithinTolerance(self):
+        points = [[10 * math.cos(t / 20.0), 10 * math.sin(t / 20.0)] for t in range(126)]
+        simplified = trail.simplify(points, 0.5)
+        self.assertTrue(len(simplified) < len(points))
+        self.assertEqual(simplified[0], points[0])
+        self.assertEqual(simplified[-1], points[-1])
+
+
+class TestTrail(unittest.TestCase):
+
+    def orbit(self, count):
+        return [[100 * math.cos(t / 50.0), 100 * math.sin(t / 50.0) + t / 100.0] for t in range(count)]
+
+    def testRecentPointsAreExact(self):
+        path = trail.Trail(levelLength=100)
+        points = self.orbit(1000)
+        for point in points:
+            path.append(point)
+        self.assertEqual(path.points()[-50:], points[-50:])
+
+    def testBoundedAndKeepsWholeHistory(self):
+        path = trail.Trail(levelLength=100, levels=3)
+        points = self.orbit(100000)
+        for point in points:
+            path.append(point)
+
+        self.assertTrue(len(path) <= 300)
+        self.assertEqual(len(path.points()), len(path))
+        self.assertEqual(path.points()[0], points[0])
+        self.assertEqual(path.points()[-1], points[-1])
+
+    def testClear(self):
+        path = trail.Trail()
+        path.append([0, 0])
+        path.clear()
+        self.assertEqual(len(path), 0)
+        self.assertEqual(path.points(), [])
@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def simplify(points, tolerance):
+    """
+    Douglas-Peucker line simplification.
+    Returns the subset of points (always including both ends) such that no dropped
+    point lies further than tolerance from the simplified line.
+    """
+    if len(points) < 3:
+        return list(points)
+
+    path = np.asarray(points, dtype=float)
+    keep = np.zeros(len(path), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # Iterative rather than recursive: orbits can be thousands of points long.
+    stack = [(0, len(path) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, chord = path[first], path[last] - path[first]
+        offsets = path[first + 1:last] - start
+        length = np.hypot(chord[0], chord[1])
+        if length:
+            distances = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0]) / length
+        else:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+
+        furthest = np.argmax(distances)
+        if distances[furthest] > tolerance:
+            split = first + 1 + furthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return [points[index] for index in np.flatnonzero(keep)]
+
+
+class Trail:
+    """
+    A trail of points kept as a multi-resolution pyramid.
+
+    levels[0] holds the most recent points exactly as they were appended. Whenever a
+    level grows past levelLength, its oldest half is simplified with twice the previous
+    tolerance and handed on to the next, older level. The oldest level thins itself out
+    instead, so the whole history back to the first point is kept, at most
+    levels * levelLength points long however long the run.
+    """
+
+    def __init__(self, levelLength=400, levels=4, tolerance=0.25):
+        self.levelLength = levelLength
+        self.tolerance = tolerance
+        self.levels = [[] for i in range(levels)]
+        self._points = None
+
+    def append(self, point):
+        self.levels[0].append(point)
+        self._points = None
+
+        level = 0
+        while len(self.levels[level]) > self.levelLength:
+            self._demote(level)
+            if level == len(self.levels) - 1:
+                break
+            level += 1
+
+    def _demote(self, level):
+        points = self.levels[level]
+        if level == len(self.levels) - 1:
+            # Nowhere older to go: simplify in place, and halve what's left if that wasn't enough.
+            points = simplify(points, self.tolerance * 2 ** (level + 1))
+            if len(points) > self.levelLength // 2:
+                points = points[:-1:2] + points[-1:]
+            self.levels[level] = points
+            return
+
+        half = len(points) // 2
+        self.levels[level] = points[half:]
+        self.levels[level + 1].extend(simplify(points[:half], self.tolerance * 2 ** (level + 1)))
+
+    def points(self):
+        """ Every stored point, oldest first, ready to be drawn as one line """
+        if self._points is None:
+            self._points = []
+            for level in reversed(self.levels):
+                self._points.extend(level)
+        return self._points
+
+    def clear(self):
+        self.levels = [[] for level in self.levels]
+        self._points = None
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels)